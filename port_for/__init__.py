@@ -3,30 +3,103 @@
 
 __version__ = "1.0.0"
 
-from ._ranges import UNASSIGNED_RANGES
+from typing import TYPE_CHECKING, Any
+
 from .api import (
+    PortStatus,
     PortType,
     available_good_ports,
     available_ports,
+    check_ports,
+    clear_cache,
     get_port,
+    get_port_block,
+    get_ports,
     good_port_ranges,
     is_available,
     port_is_used,
     select_random,
 )
 from .exceptions import PortForException
-from .store import PortStore
+from .probe import (
+    BindProber,
+    CachingProber,
+    ConnectBindProber,
+    FakeProber,
+    Prober,
+    SnapshotProber,
+    get_default_prober,
+    set_default_prober,
+)
+
+if TYPE_CHECKING:
+    from ._backends import BindingLease
+    from .aio import async_get_port, async_port_is_used, async_select_random
+    from .allocator import PortAllocator
+    from .lease import PortLease, reserve_port
+    from .registry import PortRegistry
+    from .store import PortStore
+
+# names only imported when asked for, with the submodule providing them;
+# most callers just need get_port and never pay for asyncio, the stores
+# (configparser, sqlite3, file locking) or the registry
+_LAZY_NAMES = {
+    "async_get_port": "aio",
+    "async_port_is_used": "aio",
+    "async_select_random": "aio",
+    "BindingLease": "_backends",
+    "PortAllocator": "allocator",
+    "PortLease": "lease",
+    "reserve_port": "lease",
+    "PortRegistry": "registry",
+    "PortStore": "store",
+}
 
 __all__ = (
     "UNASSIGNED_RANGES",
     "available_good_ports",
     "available_ports",
+    "clear_cache",
     "is_available",
+    "check_ports",
+    "PortStatus",
     "good_port_ranges",
     "port_is_used",
     "select_random",
     "get_port",
+    "get_ports",
+    "get_port_block",
+    "reserve_port",
+    "PortLease",
+    "PortRegistry",
+    "PortAllocator",
+    "Prober",
+    "ConnectBindProber",
+    "BindProber",
+    "SnapshotProber",
+    "FakeProber",
+    "CachingProber",
+    "get_default_prober",
+    "set_default_prober",
+    "async_get_port",
+    "async_port_is_used",
+    "async_select_random",
     "PortStore",
+    "BindingLease",
     "PortType",
     "PortForException",
 )
+
+
+def __getattr__(name: str) -> Any:
+    # UNASSIGNED_RANGES is a large literal, only parse it when asked for;
+    # port_for.unassigned provides the same data as a bitmap.
+    if name == "UNASSIGNED_RANGES":
+        from ._ranges import UNASSIGNED_RANGES
+
+        return UNASSIGNED_RANGES
+    if name in _LAZY_NAMES:
+        # relative import of the submodule, without paying for importlib
+        module = __import__(_LAZY_NAMES[name], globals(), level=1)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
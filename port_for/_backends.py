@@ -0,0 +1,659 @@
+"""Storage backends of :class:`port_for.PortStore`.
+
+A backend keeps app => port bindings and hands them out within
+transactions: everything read and changed in one is saved atomically
+when it ends (or not at all, if it raises).
+"""
+
+import io
+import os
+import stat
+import sys
+import threading
+from configparser import DEFAULTSECT, ConfigParser
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, ContextManager, Iterable, Iterator, NamedTuple, Protocol
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+from .exceptions import PortForException
+
+# sqlite3, json, uuid and tempfile are imported where they're used,
+# so that importing port_for doesn't pay for backends it doesn't use
+if TYPE_CHECKING:
+    import sqlite3
+
+# path suffixes selecting the sqlite backend
+SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+# path suffixes selecting the journal backend
+JOURNAL_SUFFIXES = (".journal",)
+# how many records more than bindings a journal holds before it's compacted
+JOURNAL_COMPACT_AFTER = 1000
+# seconds to wait for another process to finish writing
+SQLITE_TIMEOUT = 30.0
+# INI file section holding leases of the bindings in its default section
+INI_LEASES_SECTION = "port-for:leases"
+
+
+class BindingLease(NamedTuple):
+    """Lease of a binding: when it expires, and the process owning it."""
+
+    # time.time() the binding expires at, if ever
+    expires: float | None = None
+    # PID of the process owning the binding, if any; the binding is stale once it exits
+    pid: int | None = None
+
+
+class Bindings(Protocol):
+    """App => port bindings, as seen within a transaction.
+
+    Lookups of an app or a port use indexes, they don't scan all bindings.
+    """
+
+    def port_for_app(self, app: str) -> int | None:
+        """Return port bound to app, if any."""
+
+    def app_for_port(self, port: int) -> str | None:
+        """Return app bound to port, if any."""
+
+    def items(self) -> Iterable[tuple[str, int]]:
+        """Return (app, port) pairs, in order of binding."""
+
+    def bind(self, app: str, port: int) -> None:
+        """Bind port to app, which has no port yet."""
+
+    def unbind(self, app: str) -> None:
+        """Remove port bound to app, if any, and its lease."""
+
+    def lease(self, app: str) -> BindingLease | None:
+        """Return lease of the binding of app, if any."""
+
+    def leases(self) -> Iterable[tuple[str, BindingLease]]:
+        """Return (app, lease) pairs of all leased bindings."""
+
+    def set_lease(self, app: str, lease: BindingLease | None) -> None:
+        """Set lease of the binding of app, which has a port; None removes it."""
+
+
+class Backend(Protocol):
+    """Storage of bindings."""
+
+    def transaction(self) -> ContextManager[Bindings]:
+        """Return context manager giving bindings, saved when it exits."""
+
+    def read(self) -> ContextManager[Bindings]:
+        """Return context manager giving bindings, not to be changed."""
+
+
+def open_backend(path: str, backend: str | None = None, fsync: bool = False) -> Backend:
+    """Open backend by name, or chosen by path suffix if no name is given.
+
+    :param backend: "ini", "sqlite" or "journal"
+    :param fsync: flush changes to disk before transactions end
+        (SQLite always does)
+    """
+    if backend is None:
+        if path.endswith(SQLITE_SUFFIXES):
+            backend = "sqlite"
+        elif path.endswith(JOURNAL_SUFFIXES):
+            backend = "journal"
+        else:
+            backend = "ini"
+    if backend == "ini":
+        return IniBackend(path, fsync)
+    if backend == "sqlite":
+        return SqliteBackend(path)
+    if backend == "journal":
+        return JournalBackend(path, fsync)
+    raise PortForException(f"Unknown store backend: {backend}")
+
+
+@contextmanager
+def _locked(lock_path: str, path: str) -> Iterator[None]:
+    """Hold an exclusive lock of lock_path, where ``fcntl`` is available.
+
+    Where lock_path can't be created, e.g. in a directory only root can
+    write to, an existing lock_path, or else path itself, is locked.
+    """
+    if sys.platform == "win32":
+        yield
+        return
+    try:
+        fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o666)
+    except PermissionError:
+        # flock works on descriptors open for reading too
+        try:
+            fd = os.open(lock_path, os.O_RDONLY)
+        except FileNotFoundError:
+            fd = os.open(path, os.O_RDONLY)
+    try:
+        # flock, unlike lockf, also excludes other descriptors of this process
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _replace(path: str, data: bytes, fsync: bool) -> None:
+    """Replace file at path with a new one holding data, keeping its permissions.
+
+    The new file keeps the owner and group of the old one too, where the
+    current user may set them (e.g. as root). Where the directory is
+    not writable, but the file is, the file is rewritten in place instead:
+    readers may then see it half written.
+    """
+    import tempfile
+
+    directory, filename = os.path.split(os.path.abspath(path))
+    try:
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{filename}.", dir=directory)
+    except PermissionError:
+        with open(path, "r+b") as f:
+            f.write(data)
+            f.truncate()
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        return
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        # keep the file readable, and writable, by whoever could access it
+        if os.path.exists(path):
+            st = os.stat(path)
+            os.chmod(tmp_path, stat.S_IMODE(st.st_mode))
+            _copy_owner(tmp_path, st)
+        else:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _copy_owner(path: str, st: os.stat_result) -> None:
+    """Give path the owner and group of st, or just the group, as far as permitted."""
+    if sys.platform == "win32":
+        return
+    for uid in (st.st_uid, -1):
+        try:
+            os.chown(path, uid, st.st_gid)
+            return
+        except PermissionError:
+            pass
+
+
+class _IndexedBindings:
+    """Bindings kept in memory, indexed by app and by port."""
+
+    def __init__(
+        self,
+        items: Iterable[tuple[str, int]] = (),
+        leases: Iterable[tuple[str, BindingLease]] = (),
+    ) -> None:
+        self.changed = False
+        self._port_by_app = dict(items)
+        self._app_by_port = {port: app for app, port in self._port_by_app.items()}
+        self._leases = {app: lease for app, lease in leases if app in self._port_by_app}
+
+    def port_for_app(self, app: str) -> int | None:
+        return self._port_by_app.get(app)
+
+    def app_for_port(self, port: int) -> str | None:
+        return self._app_by_port.get(port)
+
+    def items(self) -> Iterable[tuple[str, int]]:
+        return self._port_by_app.items()
+
+    def bind(self, app: str, port: int) -> None:
+        self._port_by_app[app] = port
+        self._app_by_port[port] = app
+        self.changed = True
+
+    def unbind(self, app: str) -> None:
+        port = self._port_by_app.pop(app, None)
+        if port is not None:
+            del self._app_by_port[port]
+            self._leases.pop(app, None)
+            self.changed = True
+
+    def lease(self, app: str) -> BindingLease | None:
+        return self._leases.get(app)
+
+    def leases(self) -> Iterable[tuple[str, BindingLease]]:
+        return self._leases.items()
+
+    def set_lease(self, app: str, lease: BindingLease | None) -> None:
+        if lease is None:
+            self._leases.pop(app, None)
+        else:
+            self._leases[app] = lease
+        self.changed = True
+
+    def __len__(self) -> int:
+        return len(self._port_by_app)
+
+
+class IniBackend:
+    """Bindings stored as options of the default section of an INI file.
+
+    Leases are stored in the ``port-for:leases`` section, as
+    ``app = expires=<timestamp> pid=<pid>``.
+
+    Changes are made holding an exclusive lock on a ``.lock`` file next
+    to it (where ``fcntl`` is available), and written to a temporary file
+    replacing the INI file, so readers never see it half written; the
+    new file keeps the mode, and where permitted the owner and group,
+    of the old one. Where only the file is writable,
+    not its directory (as ``/etc/port-for.conf`` may be for non-root
+    users), the file itself is locked and rewritten in place.
+    The parsed file is kept in memory, and only read again once its
+    modification time, size or inode change.
+    """
+
+    def __init__(self, path: str, fsync: bool = False) -> None:
+        """Initialize IniBackend."""
+        self.path = path
+        self.fsync = fsync
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.Lock()
+        self._bindings: _IniBindings | None = None
+        # (mtime, size, inode) of the file when _bindings were read
+        self._stat_key: tuple[int, int, int] | None = None
+
+    @contextmanager
+    def transaction(self) -> Iterator[Bindings]:
+        """Lock and read the file, and replace it if bindings were changed."""
+        with self._lock, _locked(self.lock_path, self.path):
+            bindings = self._get_bindings()
+            try:
+                yield bindings
+            except BaseException:
+                if bindings.changed:
+                    # changes were made to the cached copy, don't keep them
+                    self._bindings = None
+                raise
+            if bindings.changed:
+                try:
+                    self._save(bindings.parser)
+                finally:
+                    bindings.changed = False
+
+    @contextmanager
+    def read(self) -> Iterator[Bindings]:
+        """Give bindings as last read, reading the file again only if it changed."""
+        with self._lock:
+            yield self._get_bindings()
+
+    def _ensure_config_exists(self) -> None:
+        if not os.path.exists(self.path):
+            with open(self.path, "w"):
+                pass
+
+    def _current_stat_key(self) -> tuple[int, int, int]:
+        st = os.stat(self.path)
+        return st.st_mtime_ns, st.st_size, st.st_ino
+
+    def _get_bindings(self) -> "_IniBindings":
+        self._ensure_config_exists()
+        stat_key = self._current_stat_key()
+        if self._bindings is None or stat_key != self._stat_key:
+            parser = _ini_parser()
+            parser.read(self.path)
+            self._bindings, self._stat_key = _IniBindings(parser), stat_key
+        return self._bindings
+
+    def _save(self, parser: ConfigParser) -> None:
+        text = io.StringIO()
+        parser.write(text)
+        try:
+            _replace(self.path, text.getvalue().encode(), self.fsync)
+        except BaseException:
+            self._bindings = None
+            raise
+        self._stat_key = self._current_stat_key()
+
+
+class _IniBindings(_IndexedBindings):
+    """Indexed bindings, kept in sync with the parser."""
+
+    def __init__(self, parser: ConfigParser) -> None:
+        super().__init__(
+            ((app, int(port)) for app, port in _ini_items(parser, DEFAULTSECT)),
+            (
+                (app, _parse_ini_lease(value))
+                for app, value in _ini_items(parser, INI_LEASES_SECTION)
+            ),
+        )
+        self.parser = parser
+
+    def bind(self, app: str, port: int) -> None:
+        self._set(DEFAULTSECT, app, str(port))
+        super().bind(app, port)
+
+    def unbind(self, app: str) -> None:
+        if self.port_for_app(app) is not None:
+            self._remove(DEFAULTSECT, app)
+            self._remove(INI_LEASES_SECTION, app)
+        super().unbind(app)
+        self._drop_empty_leases()
+
+    def set_lease(self, app: str, lease: BindingLease | None) -> None:
+        if lease is None:
+            self._remove(INI_LEASES_SECTION, app)
+        else:
+            fields = lease._asdict().items()
+            value = " ".join(f"{name}={value}" for name, value in fields if value is not None)
+            self._set(INI_LEASES_SECTION, app, value)
+        super().set_lease(app, lease)
+        self._drop_empty_leases()
+
+    def _drop_empty_leases(self) -> None:
+        if not self._leases:
+            self.parser.remove_section(INI_LEASES_SECTION)
+
+    def _set(self, section: str, option: str, value: str) -> None:
+        if not self.parser.has_section(section):
+            self.parser.add_section(section)
+        self.parser.set(section, option, value)
+
+    def _remove(self, section: str, option: str) -> None:
+        if self.parser.has_section(section):
+            self.parser.remove_option(section, option)
+
+
+def _ini_parser() -> ConfigParser:
+    # [DEFAULT] holds bindings; it's made a regular section, so that its
+    # options don't show up in the leases section
+    return ConfigParser(default_section="port-for:no-defaults")
+
+
+def _ini_items(parser: ConfigParser, section: str) -> list[tuple[str, str]]:
+    return parser.items(section) if parser.has_section(section) else []
+
+
+def _parse_ini_lease(value: str) -> BindingLease:
+    fields = dict(field.partition("=")[::2] for field in value.split())
+    expires, pid = fields.get("expires"), fields.get("pid")
+    return BindingLease(
+        None if expires is None else float(expires), None if pid is None else int(pid)
+    )
+
+
+class JournalBackend:
+    """Bindings stored as an append-only log of bind and unbind records.
+
+    Each transaction appends records of its changes, at a cost independent
+    of the number of bindings; with ``fsync``, they are flushed to disk
+    before it ends. The log is replayed when first read, then only
+    records appended since (e.g. by other processes) are. Once it holds
+    ``compact_after`` records more than there are bindings, it's
+    compacted: replaced by a log with one record per binding.
+
+    Records are JSON arrays, one per line: ``["bind", app, port]``,
+    ``["unbind", app]``, ``["lease", app, expires, pid]`` and, removing
+    a lease, ``["lease", app]``. The first line identifies the
+    log, so readers notice when it's replaced. A record left half written
+    by a crashed writer is ignored, then dropped by the next writer.
+    Writers hold an exclusive lock on a ``.lock`` file next to the log.
+    """
+
+    def __init__(
+        self, path: str, fsync: bool = False, compact_after: int = JOURNAL_COMPACT_AFTER
+    ) -> None:
+        """Initialize JournalBackend."""
+        self.path = path
+        self.fsync = fsync
+        self.compact_after = compact_after
+        self.lock_path = f"{path}.lock"
+        self._lock = threading.Lock()
+        self._bindings = _JournalBindings()
+        # first line of the log replayed, bytes and records replayed from it
+        self._header = b""
+        self._offset = 0
+        self._records = 0
+
+    @contextmanager
+    def transaction(self) -> Iterator[Bindings]:
+        """Lock and catch up with the log, then append records of the changes."""
+        with self._lock, _locked(self.lock_path, self.path):
+            bindings = self._catch_up(writing=True)
+            try:
+                yield bindings
+            except BaseException:
+                if bindings.changed:
+                    # changes were made to the replayed state, replay it again
+                    self._reset()
+                raise
+            if bindings.changed:
+                self._append(bindings)
+                if self._records - bindings.live_records() >= self.compact_after:
+                    self._compact(bindings)
+
+    @contextmanager
+    def read(self) -> Iterator[Bindings]:
+        """Give bindings, replaying records appended since last read."""
+        with self._lock:
+            yield self._catch_up()
+
+    def _reset(self) -> None:
+        self._bindings = _JournalBindings()
+        self._header = b""
+        self._offset = self._records = 0
+
+    def _catch_up(self, writing: bool = False) -> "_JournalBindings":
+        try:
+            f = open(self.path, "r+b" if writing else "rb")
+        except FileNotFoundError:
+            self._reset()
+            return self._bindings
+        with f:
+            header = f.readline()
+            if header != self._header or os.fstat(f.fileno()).st_size < self._offset:
+                # log was replaced, e.g. compacted by another process
+                self._reset()
+                if header.endswith(b"\n"):
+                    if not header.startswith(b'["journal"'):
+                        raise PortForException(f"Not a port-for journal: {self.path}")
+                    self._header, self._offset = header, len(header)
+            f.seek(self._offset)
+            data = f.read()
+            # skip a record being written, or left half written by a crashed writer
+            complete = data.rfind(b"\n") + 1
+            import json
+
+            for line in data[:complete].splitlines():
+                try:
+                    self._bindings.replay(json.loads(line))
+                except (ValueError, KeyError) as e:
+                    raise PortForException(f"Corrupted journal {self.path}: {line!r}") from e
+                self._records += 1
+            self._offset += complete
+            if writing and complete < len(data):
+                f.truncate(self._offset)
+        return self._bindings
+
+    def _append(self, bindings: "_JournalBindings") -> None:
+        data = b"".join(bindings.pending)
+        if not self._header:
+            self._header = _journal_header()
+            data = self._header + data
+        try:
+            with open(self.path, "ab") as f:
+                f.write(data)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        except BaseException:
+            self._reset()
+            raise
+        self._offset += len(data)
+        self._records += len(bindings.pending)
+        bindings.pending.clear()
+        bindings.changed = False
+
+    def _compact(self, bindings: "_JournalBindings") -> None:
+        header = _journal_header()
+        records = [_journal_record("bind", app, port) for app, port in bindings.items()]
+        records.extend(_journal_record("lease", app, *lease) for app, lease in bindings.leases())
+        data = header + b"".join(records)
+        _replace(self.path, data, self.fsync)
+        self._header = header
+        self._offset = len(data)
+        self._records = len(records)
+
+
+class _JournalBindings(_IndexedBindings):
+    """Indexed bindings, with records of changes pending to be appended."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.pending: list[bytes] = []
+
+    def bind(self, app: str, port: int) -> None:
+        super().bind(app, port)
+        self.pending.append(_journal_record("bind", app, port))
+
+    def unbind(self, app: str) -> None:
+        if self.port_for_app(app) is not None:
+            self.pending.append(_journal_record("unbind", app))
+        super().unbind(app)
+
+    def set_lease(self, app: str, lease: BindingLease | None) -> None:
+        super().set_lease(app, lease)
+        self.pending.append(_journal_record("lease", app, *(lease or ())))
+
+    def live_records(self) -> int:
+        """Return number of records the log holds once compacted."""
+        return len(self._port_by_app) + len(self._leases)
+
+    def replay(self, record: list[str | int | float | None]) -> None:
+        """Apply a record read from the log."""
+        if record[0] == "bind":
+            super().bind(str(record[1]), int(record[2]))  # type: ignore[arg-type]
+        elif record[0] == "unbind":
+            super().unbind(str(record[1]))
+        elif record[0] == "lease":
+            lease = BindingLease(*record[2:]) if len(record) > 2 else None  # type: ignore[arg-type]
+            super().set_lease(str(record[1]), lease)
+        else:
+            raise ValueError(f"Unknown record {record[0]}")
+
+
+def _journal_header() -> bytes:
+    import uuid
+
+    return _journal_record("journal", uuid.uuid4().hex)
+
+
+def _journal_record(*fields: str | int | float | None) -> bytes:
+    import json
+
+    return json.dumps(fields).encode() + b"\n"
+
+
+class SqliteBackend:
+    """Bindings stored in an SQLite database in WAL mode.
+
+    Each transaction takes the database write lock up front, so
+    concurrent processes binding ports are serialized instead of
+    overwriting each other's changes; unique constraints guarantee no
+    app nor port is bound twice. Lookups use indexes.
+    """
+
+    def __init__(self, path: str) -> None:
+        """Open the database, creating it if needed."""
+        self.path = path
+        with self._connect() as conn:
+            # WAL mode is persistent; readers don't block the writer in it
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bindings ("
+                "app TEXT PRIMARY KEY, port INTEGER NOT NULL UNIQUE)"
+            )
+            # a table of its own, so databases of earlier versions need no migration
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "app TEXT PRIMARY KEY, expires REAL, pid INTEGER)"
+            )
+
+    @contextmanager
+    def transaction(self) -> Iterator[Bindings]:
+        """Run an immediate transaction, committed when it exits."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield _SqliteBindings(conn)
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    @contextmanager
+    def read(self) -> Iterator[Bindings]:
+        """Give bindings, as committed."""
+        with self._connect() as conn:
+            yield _SqliteBindings(conn)
+
+    @contextmanager
+    def _connect(self) -> Iterator["sqlite3.Connection"]:
+        import sqlite3
+
+        # autocommit mode; transactions are started explicitly
+        conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+class _SqliteBindings:
+    def __init__(self, conn: "sqlite3.Connection") -> None:
+        self.conn = conn
+
+    def port_for_app(self, app: str) -> int | None:
+        row = self.conn.execute("SELECT port FROM bindings WHERE app = ?", (app,)).fetchone()
+        return None if row is None else int(row[0])
+
+    def app_for_port(self, port: int) -> str | None:
+        row = self.conn.execute("SELECT app FROM bindings WHERE port = ?", (port,)).fetchone()
+        return None if row is None else str(row[0])
+
+    def items(self) -> list[tuple[str, int]]:
+        rows = self.conn.execute("SELECT app, port FROM bindings ORDER BY rowid")
+        return [(str(app), int(port)) for app, port in rows]
+
+    def bind(self, app: str, port: int) -> None:
+        import sqlite3
+
+        try:
+            self.conn.execute("INSERT INTO bindings (app, port) VALUES (?, ?)", (app, port))
+        except sqlite3.IntegrityError as e:
+            raise PortForException(f"Can't bind port {port} to {app}: {e}") from e
+
+    def unbind(self, app: str) -> None:
+        self.conn.execute("DELETE FROM bindings WHERE app = ?", (app,))
+        self.conn.execute("DELETE FROM leases WHERE app = ?", (app,))
+
+    def lease(self, app: str) -> BindingLease | None:
+        row = self.conn.execute("SELECT expires, pid FROM leases WHERE app = ?", (app,)).fetchone()
+        return None if row is None else BindingLease(*row)
+
+    def leases(self) -> list[tuple[str, BindingLease]]:
+        rows = self.conn.execute("SELECT app, expires, pid FROM leases ORDER BY rowid")
+        return [(str(app), BindingLease(expires, pid)) for app, expires, pid in rows]
+
+    def set_lease(self, app: str, lease: BindingLease | None) -> None:
+        if lease is None:
+            self.conn.execute("DELETE FROM leases WHERE app = ?", (app,))
+        else:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO leases (app, expires, pid) VALUES (?, ?, ?)",
+                (app, *lease),
+            )
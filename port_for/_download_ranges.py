@@ -24,19 +24,31 @@ IANA_NS = "http://www.iana.org/assignments"
 WIKIPEDIA_PAGE = "http://en.wikipedia.org/wiki/List_of_TCP_and_UDP_port_numbers"
 
 
-def _write_unassigned_ranges(out_filename: str) -> None:
+def _write_unassigned_ranges(out_filename: str, ports: Iterable[int]) -> None:
     """
-    Downloads ports data from IANA & Wikipedia and converts
-    it to a python module. This function is used to generate _ranges.py.
+    Converts ports data downloaded from IANA & Wikipedia
+    to a python module. This function is used to generate _ranges.py.
     """
     with open(out_filename, "wt") as f:
         f.write("# auto-generated by port_for._download_ranges (%s)\n" % datetime.date.today())
         f.write("UNASSIGNED_RANGES = [\n")
-        for range in to_ranges(sorted(list(_unassigned_ports()))):
+        for range in to_ranges(sorted(list(ports))):
             f.write("    (%d, %d),\n" % range)
         f.write("]\n")
 
 
+def _write_unassigned_bitmap(out_filename: str, ports: Iterable[int]) -> None:
+    """
+    Writes unassigned ports as a 65536-bit bitmap (bit N set means port N
+    is unassigned, least significant bit first), read by port_for.unassigned.
+    """
+    bitmap = bytearray(65536 // 8)
+    for port in ports:
+        bitmap[port >> 3] |= 1 << (port & 7)
+    with open(out_filename, "wb") as f:
+        f.write(bytes(bitmap))
+
+
 def _unassigned_ports() -> set[int]:
     """Return a set of all unassigned ports (according to IANA and Wikipedia)"""
     free_ports = ranges_to_set(_parse_ranges(_iana_unassigned_port_ranges()))
@@ -87,4 +99,6 @@ def _parse_ranges(ranges: Iterable[str]) -> Iterator[tuple[int, int]]:
 
 
 if __name__ == "__main__":
-    _write_unassigned_ranges("_ranges.py")
+    unassigned_ports = _unassigned_ports()
+    _write_unassigned_ranges("_ranges.py", unassigned_ports)
+    _write_unassigned_bitmap("_unassigned.bin", unassigned_ports)
@@ -0,0 +1,95 @@
+"""asyncio counterparts of port_for functions.
+
+Kept apart from :mod:`port_for.api`, so that importing port_for doesn't
+import asyncio; ``port_for.async_*`` names are loaded from here on first use.
+"""
+
+import asyncio
+import socket
+from typing import Iterable
+
+from .api import PortType, _ports_from_spec, _sample_candidates
+from .exceptions import PortForException
+from .probe import PROBE_TIMEOUT, _can_bind
+from .utils import PortRanges
+
+# how many ports are probed at the same time by async_select_random
+ASYNC_PROBE_CONCURRENCY = 10
+
+
+async def async_select_random(
+    ports: set[int] | PortRanges | None = None,
+    exclude_ports: Iterable[int] | None = None,
+    concurrency: int = ASYNC_PROBE_CONCURRENCY,
+) -> int:
+    """Return random unused port number, without blocking the event loop.
+
+    Up to ``concurrency`` candidates are probed at the same time; the first
+    one found free is returned and remaining probes are cancelled.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def probe(port: int) -> int | None:
+        async with semaphore:
+            return None if await async_port_is_used(port) else port
+
+    tasks = [
+        asyncio.ensure_future(probe(port)) for port in _sample_candidates(ports, exclude_ports)
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            port = await next_done
+            if port is not None:
+                return port
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    raise PortForException("Can't select a port")
+
+
+async def async_port_is_used(port: int, host: str = "127.0.0.1") -> bool:
+    """Return if port is used, without blocking the event loop.
+
+    Same checks as :func:`port_is_used`, with a non-blocking connect.
+    """
+    if await _async_accepts_connection(port, host):
+        return True
+    # binding doesn't block, no need to hand it over to the event loop
+    if not _can_bind(port, host):
+        return True
+    return False
+
+
+async def _async_accepts_connection(port: int, host: str) -> bool:
+    """Return True if a non-blocking connect succeeds (service is listening)."""
+    loop = asyncio.get_running_loop()
+    with socket.socket() as sock:
+        sock.setblocking(False)
+        try:
+            await asyncio.wait_for(loop.sock_connect(sock, (host, port)), timeout=PROBE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            return False
+        return True
+
+
+async def async_get_port(
+    ports: PortType | None,
+    exclude_ports: Iterable[int] | None = None,
+) -> int | None:
+    """Retun a random available port, without blocking the event loop.
+
+    Accepts the same ``ports`` specification as :func:`get_port`;
+    candidates are probed concurrently, see :func:`async_select_random`.
+    """
+    if ports == -1:
+        return None
+    elif not ports:
+        return await async_select_random(None, exclude_ports)
+
+    try:
+        return int(ports)  # type: ignore[arg-type]
+    except TypeError:
+        pass
+
+    return await async_select_random(_ports_from_spec(ports), exclude_ports)
@@ -0,0 +1,103 @@
+"""Thread-safe port allocation within a process."""
+
+import threading
+import time
+from typing import Iterable
+
+from . import api
+from .api import PortType
+from .registry import PortClaims
+from .utils import PortRanges
+
+
+class PortAllocator:
+    """Hands out ports to threads of a process, never the same one twice.
+
+    Ports stay reserved until released, or until ``ttl`` seconds pass.
+    Candidates reserved by other threads are skipped without being probed.
+    Share a single allocator in the process, e.g. as a module level object.
+
+    Pass a :class:`port_for.PortRegistry` to also claim reserved ports
+    in it, avoiding collisions with other processes.
+    """
+
+    def __init__(self, ttl: float | None = None, registry: PortClaims | None = None) -> None:
+        """Initialize PortAllocator.
+
+        :param ttl: seconds after which reserved ports are released, None to keep them
+        :param registry: claim reserved ports in this registry as well
+        """
+        self.ttl = ttl
+        self._registry = registry
+        self._lock = threading.Lock()
+        # reserved port => time.monotonic() it expires at, or None
+        self._reserved: dict[int, float | None] = {}
+
+    def select_random(
+        self,
+        ports: set[int] | PortRanges | None = None,
+        exclude_ports: Iterable[int] | None = None,
+    ) -> int:
+        """Reserve and return random unused port number, see :func:`port_for.select_random`."""
+        return api.select_random(ports, exclude_ports, registry=self)
+
+    def get_port(
+        self,
+        ports: PortType | None,
+        exclude_ports: Iterable[int] | None = None,
+    ) -> int | None:
+        """Reserve and return a random available port, see :func:`port_for.get_port`.
+
+        An exact port (e.g. 5000 or '5000') is returned as is, without being reserved.
+        """
+        return api.get_port(ports, exclude_ports, registry=self)
+
+    def get_ports(
+        self,
+        count: int,
+        ports: PortType | None = None,
+        exclude_ports: Iterable[int] | None = None,
+    ) -> list[int]:
+        """Reserve and return count distinct ports, see :func:`port_for.get_ports`."""
+        return api.get_ports(count, ports, exclude_ports, registry=self)
+
+    def claim(self, port: int) -> bool:
+        """Reserve port; return False if it's already reserved."""
+        with self._lock:
+            self._expire()
+            if port in self._reserved:
+                return False
+            if self._registry is not None and not self._registry.claim(port):
+                return False
+            self._reserved[port] = None if self.ttl is None else time.monotonic() + self.ttl
+            return True
+
+    def release(self, port: int) -> None:
+        """Release reserved port."""
+        with self._lock:
+            if port in self._reserved:
+                self._release(port)
+
+    @property
+    def reserved(self) -> frozenset[int]:
+        """Return currently reserved ports."""
+        with self._lock:
+            self._expire()
+            return frozenset(self._reserved)
+
+    def _release(self, port: int) -> None:
+        del self._reserved[port]
+        if self._registry is not None:
+            self._registry.release(port)
+
+    def _expire(self) -> None:
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        expired = [
+            port
+            for port, expires in self._reserved.items()
+            if expires is not None and expires <= now
+        ]
+        for port in expired:
+            self._release(port)
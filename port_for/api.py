@@ -1,151 +1,549 @@
 """main port-for functionality."""
 
+import enum
+import functools
 import random
-import socket
-from itertools import chain
-from typing import Iterable, Type, TypeVar
+import time
+from collections.abc import Set
+from itertools import islice
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, Type, TypeVar
 
-from port_for import ephemeral, utils
+from port_for import ephemeral, unassigned
 
-from ._ranges import UNASSIGNED_RANGES
 from .exceptions import PortForException
+from .probe import (
+    PROBE_TIMEOUT,
+    CachingProber,
+    ConnectBindProber,
+    Prober,
+    SnapshotProber,
+    _accepts_connection,
+    _can_bind,
+    get_default_prober,
+)
+from .snapshot import PortSnapshot, take_snapshot
+from .utils import PortRanges
+
+# concurrent.futures (which imports logging) is imported by the functions
+# probing in threads, so that importing port_for doesn't pay for it
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+    from .registry import PortClaims
 
 SYSTEM_PORT_RANGE = (0, 1024)
+# how many differently parametrized port models to keep memoized
+MODEL_CACHE_SIZE = 32
+# how many candidates are probed, at most, to find a single free port
+MAX_PROBES = 100
+# how many random batches, each twice as large as the previous one,
+# the adaptive search probes before scanning all remaining candidates
+ADAPTIVE_RANDOM_BATCHES = 4
 
 
 def select_random(
-    ports: set[int] | None = None,
+    ports: set[int] | PortRanges | None = None,
     exclude_ports: Iterable[int] | None = None,
+    use_snapshot: bool = False,
+    concurrency: int = 1,
+    registry: "PortClaims | None" = None,
+    shard: int = 0,
+    shards: int = 1,
+    adaptive: bool = False,
+    timeout: float | None = None,
+    deadline: float | None = None,
+    prober: Prober | None = None,
 ) -> int:
-    """Return random unused port number."""
-    if ports is None:
-        ports = available_good_ports()
+    """Return random unused port number.
+
+    By default at most :data:`MAX_PROBES` random candidates are probed.
+    With ``adaptive``, the search goes on with larger and larger random
+    batches, then scans all remaining candidates (skipping those in use
+    according to a snapshot, where supported), so it only fails when no
+    candidate is free.
+
+    Each probe waits at most ``timeout`` seconds (:data:`PROBE_TIMEOUT`
+    by default) for a connection. With a ``deadline``, in seconds, probes
+    share what remains of it: none waits past it, no new candidate is
+    probed once it passes, and the search fails.
+
+    With ``shards`` above 1, ports are split into that many disjoint parts
+    (see :meth:`PortRanges.shard`) and only the ``shard``-th part is used;
+    e.g. parallel workers, each passing its own index as ``shard``,
+    never collide.
+
+    With a ``registry``, the port is also claimed in it, so that no other
+    process sharing the registry gets it; candidates claimed by others are
+    skipped. Release it with ``registry.release(port)`` once bound.
+
+    With ``concurrency`` above 1, that many candidates are probed at the same
+    time in a thread pool; the first one found free is returned. This pays off
+    on busy hosts, where many candidates are in use and each probe is slow.
+
+    Candidates are probed by ``prober``, or the default one
+    (see :mod:`port_for.probe`).
+
+    With ``use_snapshot``, candidates are checked against a single snapshot
+    of used ports (see :mod:`port_for.snapshot`), queried only for the
+    candidates' port range, and only the selected port is confirmed by
+    binding to it. Falls back to probing every candidate where snapshots
+    are not supported.
+    """
+    expires = None if deadline is None else time.monotonic() + deadline
+    candidate_ports = _candidate_ports(ports, shard, shards)
+    excluded = set(exclude_ports or ())
+    batches: Iterable[list[int]]
+    if adaptive:
+        batches = _adaptive_batches(candidate_ports, excluded)
+    else:
+        batches = [candidate_ports.sample(MAX_PROBES, excluded)]
+    for candidates in batches:
+        is_free = _free_port_check(candidates, use_snapshot, registry, timeout, expires, prober)
+        free_ports = _find_free(candidates, 1, is_free, concurrency, registry, expires)
+        if free_ports:
+            return free_ports[0]
+        if _expired(expires):
+            raise PortForException(f"Can't select a port within {deadline} seconds")
+    if adaptive:
+        raise PortForException("Can't select a port: all candidates are in use")
+    raise PortForException("Can't select a port")
 
-    if exclude_ports is None:
-        exclude_ports = set()
 
-    ports.difference_update(set(exclude_ports))
+def _adaptive_batches(ports: PortRanges, excluded: set[int]) -> Iterator[list[int]]:
+    """Yield growing random batches of candidates, then all the remaining ones.
 
-    for port in random.sample(tuple(ports), min(len(ports), 100)):
-        if not port_is_used(port):
-            return port
-    raise PortForException("Can't select a port")
+    ``excluded`` is extended with every batch yielded.
+    """
+    size = MAX_PROBES
+    for _ in range(ADAPTIVE_RANDOM_BATCHES):
+        batch = ports.sample(size, excluded)
+        if not batch:
+            return
+        yield batch
+        excluded.update(batch)
+        size *= 2
+    remaining = ports - excluded
+    if not remaining:
+        return
+    snapshot = take_snapshot(remaining.ranges[0][0], remaining.ranges[-1][1])
+    if snapshot is not None:
+        remaining -= snapshot.used_ports
+    batch = list(remaining)
+    # don't let processes scanning at the same time race for the lowest ports
+    random.shuffle(batch)
+    yield batch
+
+
+def _probe_free(port: int, prober: Prober | None = None, timeout: float | None = None) -> bool:
+    """Return if port is free, as probed by prober or the default one.
+
+    Results of a :class:`CachingProber` are trusted only if the port is
+    used: a port about to be returned as free is probed again. Snapshots
+    may be outdated, so a port a :class:`SnapshotProber` finds free is
+    also confirmed by binding to it.
+    """
+    current = get_default_prober() if prober is None else prober
+    cache = None
+    if isinstance(current, CachingProber):
+        if current.lookup(port):
+            return False
+        cache, current = current, current.prober
+    used = port_is_used(port, timeout=PROBE_TIMEOUT if timeout is None else timeout, prober=current)
+    if cache is not None:
+        cache.remember(port, used)
+    if not used and isinstance(current, SnapshotProber):
+        return _can_bind(port, "127.0.0.1")
+    return not used
+
+
+def _expired(expires: float | None) -> bool:
+    return expires is not None and time.monotonic() >= expires
+
+
+def _probe_timeout(timeout: float | None, expires: float | None) -> float | None:
+    """Return how long a probe may wait: timeout, capped by what's left until expires."""
+    if expires is None:
+        return timeout
+    # a zero timeout would turn the connect non-blocking, never accepted
+    remaining = max(expires - time.monotonic(), 0.001)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+def _free_port_check(
+    candidates: list[int],
+    use_snapshot: bool,
+    registry: "PortClaims | None" = None,
+    timeout: float | None = None,
+    expires: float | None = None,
+    prober: Prober | None = None,
+) -> Callable[[int], bool]:
+    """Return a function telling if a candidate port is free.
+
+    With a registry, ports are claimed before being probed, and only
+    stay claimed if they are free. Probes (by ``prober``, or the default one)
+    wait for a connection at most ``timeout`` seconds, and never past ``expires``.
+    """
+    snapshot = None
+    if use_snapshot and candidates:
+        snapshot = take_snapshot(min(candidates), max(candidates))
+
+    def probe(port: int) -> bool:
+        if snapshot is None:
+            return _probe_free(port, prober, _probe_timeout(timeout, expires))
+        return not port_is_used(port, snapshot=snapshot) and _can_bind(port, "127.0.0.1")
+
+    if registry is None:
+        return probe
+
+    def claim_and_probe(port: int) -> bool:
+        if not registry.claim(port):
+            return False
+        if probe(port):
+            return True
+        registry.release(port)
+        return False
+
+    return claim_and_probe
+
+
+def _find_free(
+    candidates: list[int],
+    count: int,
+    is_free: Callable[[int], bool],
+    concurrency: int,
+    registry: "PortClaims | None" = None,
+    expires: float | None = None,
+) -> list[int]:
+    """Probe candidates in order, until count free ports are found.
+
+    Stops early, with the free ports found so far, once ``expires``
+    (a :func:`time.monotonic` value) passes.
+    Free ports found in excess by concurrent probes are released from the registry.
+    """
+    if concurrency > 1:
+        return _find_free_in_threads(candidates, count, is_free, concurrency, registry, expires)
+    free_ports = []
+    for port in candidates:
+        if _expired(expires):
+            break
+        if is_free(port):
+            free_ports.append(port)
+            if len(free_ports) == count:
+                break
+    return free_ports
+
+
+def _find_free_in_threads(
+    candidates: list[int],
+    count: int,
+    is_free: Callable[[int], bool],
+    concurrency: int,
+    registry: "PortClaims | None",
+    expires: float | None = None,
+) -> list[int]:
+    """Probe candidates in a thread pool, until count free ports are found."""
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+    free_ports: list[int] = []
+    remaining = iter(candidates)
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        # keep at most `concurrency` probes in flight, so none is wasted
+        # on candidates after enough free ports were found
+        running = {executor.submit(is_free, port): port for port in islice(remaining, concurrency)}
+        while running:
+            timeout = None if expires is None else max(expires - time.monotonic(), 0)
+            done, _ = wait(running, timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                return free_ports
+            for future in done:
+                port = running.pop(future)
+                if future.result():
+                    free_ports.append(port)
+                    if len(free_ports) == count:
+                        return free_ports
+            if _expired(expires):
+                return free_ports
+            for port in islice(remaining, len(done)):
+                running[executor.submit(is_free, port)] = port
+        return free_ports
+    finally:
+        # don't wait for probes still running, their results are not needed
+        executor.shutdown(wait=False, cancel_futures=True)
+        if registry is not None:
+            for future, port in running.items():
+                future.add_done_callback(functools.partial(_release_unneeded, registry, port))
+
+
+def _release_unneeded(registry: "PortClaims", port: int, future: "Future[bool]") -> None:
+    if not future.cancelled() and future.exception() is None and future.result():
+        registry.release(port)
+
+
+def _sample_candidates(
+    ports: set[int] | PortRanges | None,
+    exclude_ports: Iterable[int] | None,
+    count: int = MAX_PROBES,
+    shard: int = 0,
+    shards: int = 1,
+) -> list[int]:
+    """Return up to count random ports worth probing.
+
+    Neither ``ports`` nor ``exclude_ports`` are modified.
+    """
+    return _candidate_ports(ports, shard, shards).sample(count, exclude_ports or ())
+
+
+def _candidate_ports(
+    ports: set[int] | PortRanges | None, shard: int = 0, shards: int = 1
+) -> PortRanges:
+    """Return ports to select from: available good ports by default, sharded."""
+    ports = available_good_ports() if ports is None else PortRanges.from_ports(ports)
+    if shards > 1:
+        ports = ports.shard(shard, shards)
+    return ports
+
+
+def is_available(port: int, timeout: float = PROBE_TIMEOUT, prober: Prober | None = None) -> bool:
+    """Return if port is good to choose.
+
+    :param timeout: seconds to wait for the port to accept a connection
+    :param prober: probe the port with it instead of the default prober
+    """
+    return (
+        unassigned.is_unassigned(port)
+        and port not in _excluded_ports(1024, 65535, (), _ephemeral_ranges())
+        and not port_is_used(port, timeout=timeout, prober=prober)
+    )
 
 
-def is_available(port: int) -> bool:
-    """Return if port is good to choose."""
-    return port in available_ports() and not port_is_used(port)
+class PortStatus(enum.Enum):
+    """Why a port is, or is not, good to choose; see :func:`check_ports`."""
+
+    AVAILABLE = "available"
+    # system port, below or at 1024
+    SYSTEM = "system"
+    # in an OS ephemeral port range
+    EPHEMERAL = "ephemeral"
+    # assigned by IANA, i.e. out of the unassigned ranges
+    ASSIGNED = "assigned"
+    # something accepted a connection on the port
+    IN_USE_CONNECT = "in-use-connect"
+    # the port can't be bound
+    IN_USE_BIND = "in-use-bind"
+    # used according to a prober other than ConnectBindProber
+    IN_USE = "in-use"
+
+
+def check_ports(
+    ports: Iterable[int],
+    host: str = "127.0.0.1",
+    timeout: float = PROBE_TIMEOUT,
+    concurrency: int = 1,
+    prober: Prober | None = None,
+) -> dict[int, PortStatus]:
+    """Return status of each port, telling why it's (not) good to choose.
+
+    Like calling :func:`is_available` for each port, but the port model
+    is looked up once, and only ports passing it are probed; with
+    ``concurrency`` above 1, that many at the same time.
+
+    Ports are probed by ``prober``, or the default one. Ports used
+    according to a :class:`ConnectBindProber` are told apart by how
+    they were found used (IN_USE_CONNECT or IN_USE_BIND); those used
+    according to any other prober are IN_USE.
+
+    >>> check_ports([80, 5432])
+    {80: <PortStatus.SYSTEM: 'system'>, 5432: <PortStatus.ASSIGNED: 'assigned'>}
+
+    :raises ValueError: for numbers that are not TCP ports
+    """
+    ephemeral_ports = PortRanges(_ephemeral_ranges())
+    unassigned_ports = unassigned.port_ranges()
+    statuses: dict[int, PortStatus] = {}
+    to_probe = []
+    for port in ports:
+        if not 0 <= port <= 65535:
+            raise ValueError(f"Invalid port: {port}")
+        if port <= SYSTEM_PORT_RANGE[1]:
+            statuses[port] = PortStatus.SYSTEM
+        elif port in ephemeral_ports:
+            statuses[port] = PortStatus.EPHEMERAL
+        elif port not in unassigned_ports:
+            statuses[port] = PortStatus.ASSIGNED
+        elif port not in statuses:
+            # placeholder, keeps ports in the given order
+            statuses[port] = PortStatus.AVAILABLE
+            to_probe.append(port)
+
+    current = get_default_prober() if prober is None else prober
+    probe = functools.partial(_probe_status, host=host, timeout=timeout, prober=current)
+    if concurrency > 1 and len(to_probe) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            statuses.update(zip(to_probe, executor.map(probe, to_probe)))
+    else:
+        statuses.update(zip(to_probe, map(probe, to_probe)))
+    return statuses
+
+
+def _probe_status(port: int, host: str, timeout: float, prober: Prober) -> PortStatus:
+    if isinstance(prober, ConnectBindProber):
+        # the same probes, telling which one found the port used
+        if _accepts_connection(port, host, timeout):
+            return PortStatus.IN_USE_CONNECT
+        if not _can_bind(port, host):
+            return PortStatus.IN_USE_BIND
+        return PortStatus.AVAILABLE
+    if prober.is_used(port, host, timeout):
+        return PortStatus.IN_USE
+    return PortStatus.AVAILABLE
 
 
 def available_ports(
     low: int = 1024,
     high: int = 65535,
-    exclude_ranges: list[tuple[int, int]] | None = None,
-) -> set[int]:
+    exclude_ranges: Iterable[Iterable[int]] | None = None,
+) -> PortRanges:
     """Return a set of possible ports.
 
     .. note::
 
         Excluding system, ephemeral and well-known ports.
 
-    Pass ``high`` and/or ``low`` to limit the port range.
+    Pass ``high`` and/or ``low`` to limit the port range, and
+    ``exclude_ranges`` as (low, high) pairs, e.g. lists read from a config.
     """
-    if exclude_ranges is None:
-        exclude_ranges = []
-    available = utils.ranges_to_set(UNASSIGNED_RANGES)
-    exclude = utils.ranges_to_set(
-        # Motivation behind excluding ephemeral port ranges:
-        # let's say you decided to use an ephemeral local port
-        # as a persistent port, and "reserve" it to your software.
-        # OS won't know about it, and still can try to use this port.
-        # This is not a problem if your service is always running and occupying
-        # this port (OS would pick next one). But if the service is temporarily
-        # not using the port (because of restart of other reason),
-        # OS might reuse the same port,
-        # which might prevent the service from starting.
-        ephemeral.port_ranges()
-        + exclude_ranges
-        + [SYSTEM_PORT_RANGE, (SYSTEM_PORT_RANGE[1], low), (high, 65536)]
-    )
-    return available.difference(exclude)
+    # hashable, as models are memoized per excluded ranges
+    excluded = tuple((int(lo), int(hi)) for lo, hi in exclude_ranges or ())
+    return _available_ports(low, high, excluded, _ephemeral_ranges())
 
 
 def good_port_ranges(
-    ports: set[int] | None = None, min_range_len: int = 20, border: int = 3
+    ports: set[int] | PortRanges | None = None, min_range_len: int = 20, border: int = 3
 ) -> list[tuple[int, int]]:
     """Return a list of 'good' port ranges.
 
     Such ranges are large and don't contain ephemeral or well-known ports.
     Ranges borders are also excluded.
     """
-    min_range_len += border * 2
     if ports is None:
-        ports = available_ports()
-    ranges = utils.to_ranges(list(ports))
-    lenghts = sorted([(r[1] - r[0], r) for r in ranges], reverse=True)
-    long_ranges = [length[1] for length in lenghts if length[0] >= min_range_len]
-    without_borders = [(low + border, high - border) for low, high in long_ranges]
-    return without_borders
+        return list(_good_port_ranges(min_range_len, border, _ephemeral_ranges()))
+    return _find_good_ranges(PortRanges.from_ports(ports), min_range_len, border)
 
 
-def available_good_ports(min_range_len: int = 20, border: int = 3) -> set[int]:
-    """List available good ports."""
-    return utils.ranges_to_set(good_port_ranges(min_range_len=min_range_len, border=border))
+def available_good_ports(
+    min_range_len: int = 20, border: int = 3, shard: int = 0, shards: int = 1
+) -> PortRanges:
+    """List available good ports.
 
+    Pass ``shards`` to get only the ``shard``-th of that many disjoint parts.
+    """
+    ports = _available_good_ports(min_range_len, border, _ephemeral_ranges())
+    if shards > 1:
+        return ports.shard(shard, shards)
+    return ports
 
-def port_is_used(port: int, host: str = "127.0.0.1") -> bool:
-    """Return if port is used.
 
-    If we can connect to the port or we cannot bind to it, it's used.
+def clear_cache() -> None:
+    """Forget memoized port models and ephemeral port ranges.
+
+    Models are cached per ephemeral port ranges, so a change of the OS
+    configuration is picked up once ``ephemeral.CACHE_TTL`` passes;
+    call this to pick it up immediately. Results cached by the default
+    prober, if it's a :class:`port_for.probe.CachingProber`, are forgotten too.
     """
-    # Used if something is listening on the port, and we can connect to it
-    if _accepts_connection(port, host):
-        return True
-    # Used if we cannot bind to the port.
-    if not _can_bind(port, host):
-        return True
-    return False
+    default_prober = get_default_prober()
+    if isinstance(default_prober, CachingProber):
+        default_prober.clear()
+    ephemeral.clear_cache()
+    _excluded_ports.cache_clear()
+    _available_ports.cache_clear()
+    _good_port_ranges.cache_clear()
+    _available_good_ports.cache_clear()
+
+
+def _ephemeral_ranges() -> tuple[tuple[int, int], ...]:
+    return tuple(ephemeral.port_ranges())
+
+
+@functools.lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _excluded_ports(
+    low: int,
+    high: int,
+    exclude_ranges: tuple[tuple[int, int], ...],
+    ephemeral_ranges: tuple[tuple[int, int], ...],
+) -> PortRanges:
+    return PortRanges(
+        # Motivation behind excluding ephemeral port ranges:
+        # let's say you decided to use an ephemeral local port
+        # as a persistent port, and "reserve" it to your software.
+        # OS won't know about it, and still can try to use this port.
+        # This is not a problem if your service is always running and occupying
+        # this port (OS would pick next one). But if the service is temporarily
+        # not using the port (because of restart of other reason),
+        # OS might reuse the same port,
+        # which might prevent the service from starting.
+        ephemeral_ranges
+        + exclude_ranges
+        + (SYSTEM_PORT_RANGE, (SYSTEM_PORT_RANGE[1], low), (high, 65536))
+    )
 
 
-def _can_bind(port: int, host: str) -> bool:
-    """Try binding on common addresses to detect if the port is free.
+@functools.lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _available_ports(
+    low: int,
+    high: int,
+    exclude_ranges: tuple[tuple[int, int], ...],
+    ephemeral_ranges: tuple[tuple[int, int], ...],
+) -> PortRanges:
+    return unassigned.port_ranges() - _excluded_ports(low, high, exclude_ranges, ephemeral_ranges)
+
+
+@functools.lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _good_port_ranges(
+    min_range_len: int, border: int, ephemeral_ranges: tuple[tuple[int, int], ...]
+) -> tuple[tuple[int, int], ...]:
+    ports = _available_ports(1024, 65535, (), ephemeral_ranges)
+    return tuple(_find_good_ranges(ports, min_range_len, border))
 
-    Some platforms (notably Windows) allow binding to 127.0.0.1 even when the
-    port is already bound on INADDR_ANY (0.0.0.0). To reliably detect usage, we
-    attempt to bind on both the requested host and INADDR_ANY. If either bind
-    fails, consider the port as used.
-    """
-    hosts_to_try = []
-    # Always try the requested host first
-    hosts_to_try.append(host)
-    # Also try INADDR_ANY for IPv4 to catch cases where 0.0.0.0 is occupied
-    if host not in ("", "0.0.0.0"):
-        hosts_to_try.append("")
-        hosts_to_try.append("0.0.0.0")
 
-    for h in hosts_to_try:
-        with socket.socket() as sock:
-            try:
-                sock.bind((h, port))
-            except socket.error:
-                return False
-    return True
+@functools.lru_cache(maxsize=MODEL_CACHE_SIZE)
+def _available_good_ports(
+    min_range_len: int, border: int, ephemeral_ranges: tuple[tuple[int, int], ...]
+) -> PortRanges:
+    return PortRanges(_good_port_ranges(min_range_len, border, ephemeral_ranges))
 
 
-def _accepts_connection(port: int, host: str) -> bool:
-    """Return True if connect_ex succeeds (service is listening).
+def _find_good_ranges(ports: PortRanges, min_range_len: int, border: int) -> list[tuple[int, int]]:
+    min_range_len += border * 2
+    lenghts = sorted([(r[1] - r[0], r) for r in ports.ranges], reverse=True)
+    long_ranges = [length[1] for length in lenghts if length[0] >= min_range_len]
+    without_borders = [(low + border, high - border) for low, high in long_ranges]
+    return without_borders
 
-    Works reliably across platforms, including Windows.
+
+def port_is_used(
+    port: int,
+    host: str = "127.0.0.1",
+    snapshot: PortSnapshot | None = None,
+    timeout: float = PROBE_TIMEOUT,
+    prober: Prober | None = None,
+) -> bool:
+    """Return if port is used.
+
+    The port is probed by ``prober``, or by the default one, which
+    considers it used if we can connect to it or we cannot bind to it
+    (see :mod:`port_for.probe`). Connecting waits at most ``timeout``
+    seconds; a port that doesn't answer by then is checked by binding only.
+    If a ``snapshot`` is passed, it is looked up instead; no sockets are opened.
     """
-    with socket.socket() as sock:
-        sock.settimeout(1)
-        sock.setblocking(True)
-        err = sock.connect_ex((host, port))
-        # Relying on ECONNREFUSED does not produce reliable results on windows,
-        # which could result in
-        # either ECONREFUSED (Mapped in windows to `WSAECONNREFUSED`),
-        # timeout or return any other error.
-        return err == 0
+    if snapshot is not None:
+        return snapshot.is_used(port)
+    if prober is None:
+        prober = get_default_prober()
+    return prober.is_used(port, host, timeout)
 
 
 T = TypeVar("T")
@@ -161,18 +559,28 @@ PortType = (
     | int
     | tuple[int, int]
     | set[int]
+    | PortRanges
     | list[str]
     | list[int]
     | list[tuple[int, int]]
     | list[set[int]]
+    | list[PortRanges]
     | list[set[int] | tuple[int, int]]
-    | list[str | int | tuple[int, int] | set[int]]
+    | list[str | int | tuple[int, int] | set[int] | PortRanges]
 )
 
 
 def get_port(
     ports: PortType | None,
     exclude_ports: Iterable[int] | None = None,
+    use_snapshot: bool = False,
+    concurrency: int = 1,
+    registry: "PortClaims | None" = None,
+    shard: int = 0,
+    shards: int = 1,
+    timeout: float | None = None,
+    deadline: float | None = None,
+    prober: Prober | None = None,
 ) -> int | None:
     """Retun a random available port.
 
@@ -184,38 +592,173 @@ def get_port(
         exact port (e.g. '8000', 8000)
         randomly selected port (None) - any random available port
         [(2000,3000)] or (2000,3000) - random available port from a given range
-        [{4002,4003}] or {4002,4003} - random of 4002 or 4003 ports
+        [{4002,4003}] or {4002,4003} - random of 4002 or 4003 ports;
+        any set works, e.g. a PortRanges from :func:`available_good_ports`
         [(2000,3000), {4002,4003}] -random of given range and set
     :param exclude_ports: A set of known ports that can not be selected.
+    :param use_snapshot: check candidates against a snapshot of used ports,
+        see :func:`select_random`
+    :param concurrency: number of candidates probed at the same time,
+        see :func:`select_random`
+    :param registry: claim the port in this registry,
+        see :func:`select_random`
+    :param shard: index of the part of ports to select from,
+        see :func:`select_random`
+    :param shards: number of disjoint parts to split ports into
+    :param timeout: seconds each probe waits for a connection,
+        see :func:`select_random`
+    :param deadline: seconds after which no more ports are probed,
+        see :func:`select_random`
+    :param prober: probe ports with it instead of the default prober
     :returns: a random free port
     :raises: ValueError
     """
     if ports == -1:
         return None
-    elif not ports:
-        return select_random(None, exclude_ports)
+    elif ports:
+        try:
+            return int(ports)  # type: ignore[arg-type]
+        except TypeError:
+            pass
+
+    return select_random(
+        _ports_from_spec(ports) if ports else None,
+        exclude_ports,
+        use_snapshot,
+        concurrency,
+        registry,
+        shard,
+        shards,
+        timeout=timeout,
+        deadline=deadline,
+        prober=prober,
+    )
 
-    try:
-        return int(ports)  # type: ignore[arg-type]
-    except TypeError:
-        pass
 
-    ports_set: set[int] = set()
+def get_ports(
+    count: int,
+    ports: PortType | None = None,
+    exclude_ports: Iterable[int] | None = None,
+    use_snapshot: bool = False,
+    concurrency: int = 1,
+    registry: "PortClaims | None" = None,
+    shard: int = 0,
+    shards: int = 1,
+    timeout: float | None = None,
+    deadline: float | None = None,
+    prober: Prober | None = None,
+) -> list[int]:
+    """Return count distinct random available ports.
+
+    Cheaper than calling :func:`get_port` in a loop: candidates are
+    selected once, and a single snapshot is used with ``use_snapshot``.
+
+    :param count: how many ports to return
+    :param ports: same specification as for :func:`get_port`;
+        a single exact port can only be returned when count is 1
+    :param exclude_ports: A set of known ports that can not be selected.
+    :param use_snapshot: check candidates against a snapshot of used ports,
+        see :func:`select_random`
+    :param concurrency: number of candidates probed at the same time,
+        see :func:`select_random`
+    :param registry: claim returned ports in this registry,
+        see :func:`select_random`
+    :param shard: index of the part of ports to select from,
+        see :func:`select_random`
+    :param shards: number of disjoint parts to split ports into
+    :param timeout: seconds each probe waits for a connection,
+        see :func:`select_random`
+    :param deadline: seconds after which no more ports are probed,
+        see :func:`select_random`
+    :param prober: probe ports with it instead of the default prober
+    :returns: a list of free ports
+    :raises PortForException: if not enough free ports were found
+    """
+    expires = None if deadline is None else time.monotonic() + deadline
+    if ports == -1 or count <= 0:
+        return []
+    elif not ports:
+        candidate_ports = available_good_ports()
+    else:
+        try:
+            exact_port = int(ports)  # type: ignore[arg-type]
+        except TypeError:
+            candidate_ports = _ports_from_spec(ports)
+        else:
+            if count != 1:
+                raise PortForException(f"Can't select {count} ports out of exact port {ports}")
+            return [exact_port]
+
+    candidates = _sample_candidates(
+        candidate_ports, exclude_ports, count * MAX_PROBES, shard, shards
+    )
+    free_ports = _find_free(
+        candidates,
+        count,
+        _free_port_check(candidates, use_snapshot, registry, timeout, expires, prober),
+        concurrency,
+        registry,
+        expires,
+    )
+    if len(free_ports) < count:
+        if registry is not None:
+            for port in free_ports:
+                registry.release(port)
+        raise PortForException(f"Can't select {count} ports, found {len(free_ports)}")
+    return free_ports
+
 
+def get_port_block(
+    size: int,
+    ports: PortType | None = None,
+    exclude_ports: Iterable[int] | None = None,
+) -> tuple[int, int]:
+    """Return a random block of size consecutive available ports.
+
+    Blocks are picked from good port ranges (or from ``ports``, given as
+    for :func:`get_port`). A single snapshot of used ports covering all
+    candidate blocks is taken where supported, so a block is rejected
+    without probing its ports one by one; only the selected block is
+    confirmed by binding to each of its ports.
+
+    :returns: first and last port of the block
+    :raises ValueError: if size is not positive
+    :raises PortForException: if no free block was found
+    """
+    if size < 1:
+        raise ValueError(f"Block size should be positive, got {size}")
+    candidate_ports = available_good_ports() if ports is None else _ports_from_spec(ports)
+    if exclude_ports is not None:
+        candidate_ports -= PortRanges.from_ports(exclude_ports)
+    first_ports = PortRanges(
+        (low, high - size + 1) for low, high in candidate_ports.ranges if high - low + 1 >= size
+    )
+    if not first_ports:
+        raise PortForException(f"No range holds {size} consecutive ports")
+    snapshot = take_snapshot(first_ports.ranges[0][0], first_ports.ranges[-1][1] + size - 1)
+
+    for first in _sample_candidates(first_ports, None):
+        block = range(first, first + size)
+        if snapshot is None:
+            if all(_probe_free(port) for port in block):
+                return first, block[-1]
+        elif not any(snapshot.is_used(port) for port in block) and all(
+            _can_bind(port, "127.0.0.1") for port in block
+        ):
+            return first, block[-1]
+    raise PortForException(f"Can't select a block of {size} ports")
+
+
+def _ports_from_spec(ports: PortType) -> PortRanges:
+    """Convert get_port's ports specification into PortRanges."""
     try:
         if not isinstance(ports, list):
             ports = [ports]
-        ranges: set[int] = utils.ranges_to_set(filter_by_type(ports, tuple))
-        nums: set[int] = set(filter_by_type(ports, int))
-        sets: set[int] = set(
-            chain(
-                *filter_by_type(
-                    ports,
-                    (set, frozenset),  # type: ignore[arg-type]
-                )
-            )
-        )
-        ports_set = ports_set.union(ranges, sets, nums)
+        ranges = PortRanges(filter_by_type(ports, tuple))
+        nums = PortRanges.from_ports(filter_by_type(ports, int))
+        # set, frozenset, or PortRanges (unioned by ranges, not port by port)
+        sets = [PortRanges.from_ports(s) for s in ports if isinstance(s, Set)]
+        return functools.reduce(PortRanges.union, sets, ranges | nums)
     except ValueError:
         raise PortForException(
             f"Unknown format of ports: {ports}.\n"
@@ -224,5 +767,3 @@ def get_port(
             '"[{4000,5000,6000}]" or list of ints "[400,5000,6000,8000]"'
             'or all of them "[(20000, 30000), {48889, 50121}, 4000, 4004]"'
         )
-
-    return select_random(ports_set, exclude_ports)
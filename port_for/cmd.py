@@ -14,8 +14,14 @@ def _list(store: PortStore) -> None:
         sys.stdout.write("%s: %s\n" % (app, port))
 
 
-def _bind(store: PortStore, app: str, port: str | None = None) -> None:
-    bound_port = store.bind_port(app, port)
+def _bind(
+    store: PortStore,
+    app: str,
+    port: str | None = None,
+    ttl: float | None = None,
+    pid: int | None = None,
+) -> None:
+    bound_port = store.bind_port(app, port, ttl=ttl, pid=pid)
     sys.stdout.write("%s\n" % bound_port)
 
 
@@ -23,6 +29,11 @@ def _unbind(store: PortStore, app: str) -> None:
     store.unbind_port(app)
 
 
+def _gc(store: PortStore) -> None:
+    for app, port in store.gc():
+        sys.stdout.write("%s: %s\n" % (app, port))
+
+
 def main() -> None:
     """port-for executable entrypoint."""
     import argparse
@@ -51,6 +62,20 @@ def main() -> None:
         dest="port",
         help="Optional specific port number for the bind command",
     )
+    parser.add_argument(
+        "--ttl",
+        metavar="SECONDS",
+        type=float,
+        dest="ttl",
+        help="Lease the bound port for SECONDS; --gc removes it afterwards",
+    )
+    parser.add_argument(
+        "--pid",
+        metavar="PID",
+        type=int,
+        dest="pid",
+        help="Lease the bound port to process PID; --gc removes it once PID exits",
+    )
     parser.add_argument(
         "--unbind",
         "-u",
@@ -65,6 +90,12 @@ def main() -> None:
         dest="list_",
         help="List all associated ports",
     )
+    parser.add_argument(
+        "--gc",
+        action="store_true",
+        dest="gc",
+        help="Remove expired associations, and those of exited processes, and list them",
+    )
     parser.add_argument(
         "--version",
         "-v",
@@ -73,14 +104,18 @@ def main() -> None:
     )
 
     args = parser.parse_args()
+    if (args.ttl is not None or args.pid is not None) and not (args.name or args.bind):
+        parser.error("--ttl and --pid only apply when binding a port")
 
     store = PortStore()
 
     if args.name:
-        _bind(store, args.name, args.port)
+        _bind(store, args.name, args.port, args.ttl, args.pid)
     elif args.bind:
-        _bind(store, args.bind, args.port)
+        _bind(store, args.bind, args.port, args.ttl, args.pid)
     elif args.list_:
         _list(store)
     elif args.unbind:
         _unbind(store, args.unbind)
+    elif args.gc:
+        _gc(store)
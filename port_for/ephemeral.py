@@ -7,13 +7,35 @@ about ephemeral port ranges.
 Currently only Linux and BSD (including OS X) are supported.
 """
 
+import functools
 import subprocess
+import time
 
 DEFAULT_EPHEMERAL_PORT_RANGE = (32768, 65535)
+# seconds for which detected port ranges are reused before asking the OS again
+CACHE_TTL = 1.0
 
 
 def port_ranges() -> list[tuple[int, int]]:
-    """Return a list of ephemeral port ranges for current machine."""
+    """Return a list of ephemeral port ranges for current machine.
+
+    Result is cached for ``CACHE_TTL`` seconds.
+    """
+    return list(_cached_port_ranges(int(time.monotonic() // CACHE_TTL)))
+
+
+def clear_cache() -> None:
+    """Forget cached ephemeral port ranges."""
+    _cached_port_ranges.cache_clear()
+
+
+@functools.lru_cache(maxsize=1)
+def _cached_port_ranges(ttl_bucket: int) -> tuple[tuple[int, int], ...]:
+    # ttl_bucket changes every CACHE_TTL seconds, forcing a new lookup
+    return tuple(_port_ranges())
+
+
+def _port_ranges() -> list[tuple[int, int]]:
     try:
         return _linux_ranges()
     except (OSError, IOError):  # not linux, try BSD
@@ -0,0 +1,115 @@
+"""Port leases: ports kept bound until the very moment they are needed.
+
+A port returned by :func:`port_for.get_port` can be taken by another
+process before the caller binds to it. A lease closes that window by
+keeping a socket bound to the selected port. The caller can then either
+hand the socket itself over to the server, or release the lease right
+before (or, with ``SO_REUSEADDR``, right after) the server binds to the port.
+"""
+
+import errno
+import socket
+import sys
+from typing import Iterable
+
+from .api import select_random
+from .exceptions import PortForException
+from .utils import PortRanges
+
+# how many selected ports may be snatched by someone else before we give up
+RESERVE_ATTEMPTS = 5
+
+
+class PortLease:
+    """A port held by a bound socket until released or detached."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        """Initialize PortLease with an already bound socket."""
+        self._socket: socket.socket | None = sock
+        self.host, self.port = sock.getsockname()[:2]
+
+    @property
+    def sock(self) -> socket.socket:
+        """Return the bound socket; it's still owned by the lease."""
+        if self._socket is None:
+            raise PortForException(f"Lease for port {self.port} was already released")
+        return self._socket
+
+    def fileno(self) -> int:
+        """Return file descriptor of the bound socket."""
+        return self.sock.fileno()
+
+    def detach(self) -> socket.socket:
+        """Hand the bound socket over to the caller, who becomes responsible for closing it."""
+        sock = self.sock
+        self._socket = None
+        return sock
+
+    def release(self) -> None:
+        """Close the socket, making the port available to be bound again."""
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    @property
+    def released(self) -> bool:
+        """Return if the lease was released or its socket detached."""
+        return self._socket is None
+
+    def __enter__(self) -> "PortLease":
+        """Use lease as a context manager, releasing it on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Release the lease."""
+        self.release()
+
+    def __repr__(self) -> str:
+        """Return representation with leased address."""
+        state = "released" if self.released else "held"
+        return f"<{self.__class__.__name__} {self.host}:{self.port} {state}>"
+
+
+def reserve_port(
+    ports: set[int] | PortRanges | None = None,
+    exclude_ports: Iterable[int] | None = None,
+    host: str = "127.0.0.1",
+    reuse_port: bool = False,
+) -> PortLease:
+    """Select a random unused port and keep it bound.
+
+    The socket gets ``SO_REUSEADDR`` (except on Windows, where it allows
+    stealing bound ports), so a server also using it can bind to the port
+    while the lease is still held. Pass ``reuse_port`` to also set
+    ``SO_REUSEPORT``, for servers binding with it.
+
+    :param ports: candidate ports, as for :func:`port_for.select_random`
+    :param exclude_ports: ports that can not be selected
+    :param host: address to bind to
+    :param reuse_port: set ``SO_REUSEPORT`` on the bound socket
+    :returns: a lease, best used as a context manager
+    :raises PortForException: if no port could be bound
+    :raises OSError: if ``host`` can't be resolved or bound to
+    """
+    if reuse_port and not hasattr(socket, "SO_REUSEPORT"):
+        raise PortForException("SO_REUSEPORT is not supported on this platform")
+    family, _, _, _, address = socket.getaddrinfo(host, None, type=socket.SOCK_STREAM)[0]
+    excluded = set(exclude_ports or ())
+    for _ in range(RESERVE_ATTEMPTS):
+        port = select_random(ports, excluded)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        if sys.platform != "win32":
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            sock.bind((address[0], port, *address[2:]))
+        except OSError as exc:
+            sock.close()
+            if exc.errno != errno.EADDRINUSE:
+                raise
+            # someone else took the port in the meantime
+            excluded.add(port)
+            continue
+        return PortLease(sock)
+    raise PortForException("Can't reserve a port")
@@ -0,0 +1,234 @@
+"""Probers: strategies telling if a local TCP port is in use.
+
+:func:`port_for.port_is_used`, and everything selecting ports through it,
+asks a prober: the one passed with ``prober=``, or the default one,
+see :func:`set_default_prober`.
+
+* :class:`ConnectBindProber` - connects, then binds (the default)
+* :class:`BindProber` - only binds, never waits for a connection
+* :class:`SnapshotProber` - looks ports up in the OS socket tables
+* :class:`FakeProber` - in-memory ports, for tests and benchmarks
+* :class:`CachingProber` - remembers results of another prober for a while
+"""
+
+import socket
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Protocol
+
+from .exceptions import PortForException
+from .snapshot import PortSnapshot, take_snapshot
+
+# seconds to wait for a probed port to accept a connection
+PROBE_TIMEOUT = 1.0
+
+
+class Prober(Protocol):
+    """Anything telling if a port is used, like :class:`ConnectBindProber`."""
+
+    def is_used(self, port: int, host: str = "127.0.0.1", timeout: float = PROBE_TIMEOUT) -> bool:
+        """Return if port is used on host, waiting at most timeout seconds."""
+
+
+class ConnectBindProber:
+    """Port is used if it accepts a connection, or if it can't be bound."""
+
+    def is_used(self, port: int, host: str = "127.0.0.1", timeout: float = PROBE_TIMEOUT) -> bool:
+        """Return if port is used on host."""
+        # Used if something is listening on the port, and we can connect to it
+        if _accepts_connection(port, host, timeout):
+            return True
+        # Used if we cannot bind to the port.
+        return not _can_bind(port, host)
+
+
+class BindProber:
+    """Port is used if it can't be bound.
+
+    Cheaper than :class:`ConnectBindProber`, as it never waits for
+    a connection, and just as correct where listening sockets prevent
+    binding to their port, as on Linux and macOS.
+    """
+
+    def is_used(self, port: int, host: str = "127.0.0.1", timeout: float = PROBE_TIMEOUT) -> bool:
+        """Return if port is used on host; timeout is ignored."""
+        return not _can_bind(port, host)
+
+
+class SnapshotProber:
+    """Port is used if a snapshot of the OS socket tables lists it.
+
+    No socket is opened per probe: a snapshot (see :mod:`port_for.snapshot`)
+    is taken for all ports, then reused until it's ``max_age`` seconds old.
+    Ports taken in the meantime are missed, so confirm the selected port
+    by binding to it. Host and timeout are ignored.
+    """
+
+    def __init__(self, max_age: float = 1.0) -> None:
+        """Initialize SnapshotProber.
+
+        :param max_age: seconds a snapshot is reused for
+        """
+        self.max_age = max_age
+        self._snapshot: PortSnapshot | None = None
+        self._taken_at = 0.0
+        self._lock = threading.Lock()
+
+    def is_used(self, port: int, host: str = "127.0.0.1", timeout: float = PROBE_TIMEOUT) -> bool:
+        """Return if port was used when the snapshot was taken."""
+        return self.snapshot().is_used(port)
+
+    def snapshot(self) -> PortSnapshot:
+        """Return current snapshot, taking a new one if it's too old.
+
+        :raises PortForException: if snapshots are not supported on this platform
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot is None or now - self._taken_at >= self.max_age:
+                snapshot = take_snapshot()
+                if snapshot is None:
+                    raise PortForException("Port snapshots are not supported on this platform")
+                self._snapshot, self._taken_at = snapshot, now
+            return self._snapshot
+
+
+class FakeProber:
+    """Ports used according to an in-memory set; no syscalls at all.
+
+    Meant for tests and benchmarks of code selecting ports.
+    """
+
+    def __init__(self, used_ports: Iterable[int] = ()) -> None:
+        """Initialize FakeProber with ports to report as used."""
+        self.used_ports = set(used_ports)
+        # how many times ports were probed
+        self.probes = 0
+
+    def is_used(self, port: int, host: str = "127.0.0.1", timeout: float = PROBE_TIMEOUT) -> bool:
+        """Return if port is in used_ports."""
+        self.probes += 1
+        return port in self.used_ports
+
+
+class CachingProber:
+    """Results of another prober, remembered for ``ttl`` seconds.
+
+    At most ``maxsize`` results are kept; the least recently used ones
+    are dropped first. Functions selecting ports trust cached "used"
+    results, but probe a port found free again before returning it.
+    """
+
+    def __init__(self, prober: Prober | None = None, ttl: float = 1.0, maxsize: int = 4096) -> None:
+        """Initialize CachingProber.
+
+        :param prober: prober whose results are cached, :class:`ConnectBindProber` by default
+        :param ttl: seconds a result is remembered for
+        :param maxsize: how many results are remembered at most
+        """
+        self.prober = ConnectBindProber() if prober is None else prober
+        self.ttl = ttl
+        self.maxsize = maxsize
+        # (host, port) => (is used, time.monotonic() it expires at)
+        self._results: OrderedDict[tuple[str, int], tuple[bool, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def is_used(self, port: int, host: str = "127.0.0.1", timeout: float = PROBE_TIMEOUT) -> bool:
+        """Return cached result, probing the port only if there's none."""
+        used = self.lookup(port, host)
+        if used is None:
+            used = self.refresh(port, host, timeout)
+        return used
+
+    def lookup(self, port: int, host: str = "127.0.0.1") -> bool | None:
+        """Return cached result, or None if there's none."""
+        key = (host, port)
+        with self._lock:
+            result = self._results.get(key)
+            if result is None:
+                return None
+            if result[1] <= time.monotonic():
+                del self._results[key]
+                return None
+            self._results.move_to_end(key)
+            return result[0]
+
+    def refresh(self, port: int, host: str = "127.0.0.1", timeout: float = PROBE_TIMEOUT) -> bool:
+        """Probe the port, ignoring any cached result, and cache the new one."""
+        used = self.prober.is_used(port, host, timeout)
+        self.remember(port, used, host)
+        return used
+
+    def remember(self, port: int, used: bool, host: str = "127.0.0.1") -> None:
+        """Cache a result obtained from the wrapped prober."""
+        key = (host, port)
+        with self._lock:
+            self._results[key] = (used, time.monotonic() + self.ttl)
+            self._results.move_to_end(key)
+            while len(self._results) > self.maxsize:
+                self._results.popitem(last=False)
+
+    def clear(self) -> None:
+        """Forget all results."""
+        with self._lock:
+            self._results.clear()
+
+    def __len__(self) -> int:
+        """Return number of cached results."""
+        return len(self._results)
+
+
+_default_prober: Prober = ConnectBindProber()
+
+
+def get_default_prober() -> Prober:
+    """Return the prober used when none is passed."""
+    return _default_prober
+
+
+def set_default_prober(prober: Prober | None) -> None:
+    """Set the prober used when none is passed; None restores :class:`ConnectBindProber`."""
+    global _default_prober
+    _default_prober = ConnectBindProber() if prober is None else prober
+
+
+def _can_bind(port: int, host: str) -> bool:
+    """Try binding on common addresses to detect if the port is free.
+
+    Some platforms (notably Windows) allow binding to 127.0.0.1 even when the
+    port is already bound on INADDR_ANY (0.0.0.0). To reliably detect usage, we
+    attempt to bind on both the requested host and INADDR_ANY. If either bind
+    fails, consider the port as used.
+    """
+    hosts_to_try = []
+    # Always try the requested host first
+    hosts_to_try.append(host)
+    # Also try INADDR_ANY for IPv4 to catch cases where 0.0.0.0 is occupied
+    if host not in ("", "0.0.0.0"):
+        hosts_to_try.append("")
+        hosts_to_try.append("0.0.0.0")
+
+    for h in hosts_to_try:
+        with socket.socket() as sock:
+            try:
+                sock.bind((h, port))
+            except socket.error:
+                return False
+    return True
+
+
+def _accepts_connection(port: int, host: str, timeout: float = PROBE_TIMEOUT) -> bool:
+    """Return True if connect_ex succeeds (service is listening).
+
+    Works reliably across platforms, including Windows.
+    """
+    with socket.socket() as sock:
+        # setblocking(True) must not follow: it would drop the timeout
+        sock.settimeout(timeout)
+        err = sock.connect_ex((host, port))
+        # Relying on ECONNREFUSED does not produce reliable results on windows,
+        # which could result in
+        # either ECONREFUSED (Mapped in windows to `WSAECONNREFUSED`),
+        # timeout or return any other error.
+        return err == 0
@@ -0,0 +1,122 @@
+"""Registry of ports claimed by processes on this machine.
+
+Processes selecting ports at the same time (e.g. parallel test workers)
+sample from the same pool and may pick the same port before any of them
+binds to it. Sharing a registry lets them claim ports atomically instead.
+
+Claims are POSIX record locks on a single registry file: byte N locked
+means port N is claimed. The kernel drops locks of a process when it
+exits, so claims are released automatically even if it crashes.
+
+Not supported on Windows.
+"""
+
+import os
+import threading
+from typing import Protocol
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+
+from .exceptions import PortForException
+
+REGISTRY_PATH_ENV = "PORT_FOR_REGISTRY"
+# registry file name in the temp directory, used by default
+DEFAULT_REGISTRY_FILENAME = "port-for.registry"
+
+
+class PortClaims(Protocol):
+    """Anything ports can be claimed in, like :class:`PortRegistry`."""
+
+    def claim(self, port: int) -> bool:
+        """Claim port; return False if it's already claimed."""
+
+    def release(self, port: int) -> None:
+        """Release claimed port."""
+
+
+class PortRegistry:
+    """Ports claimed through a registry file shared between processes.
+
+    .. note::
+
+        Record locks belong to a process, so use a single registry
+        per file in a process: closing any descriptor of the file
+        drops all locks of the process.
+    """
+
+    def __init__(self, path: str | None = None) -> None:
+        """Open the registry.
+
+        :param path: registry file, created if missing. Defaults to
+            ``$PORT_FOR_REGISTRY`` or ``port-for.registry`` in the temp directory.
+        """
+        if fcntl is None:
+            raise PortForException("PortRegistry is not supported on this platform")
+        if path is None:
+            path = os.environ.get(REGISTRY_PATH_ENV) or _default_path()
+        self.path = path
+        self._fd: int | None = os.open(path, os.O_RDWR | os.O_CREAT, 0o666)
+        self._claimed: set[int] = set()
+        self._lock = threading.Lock()
+
+    def claim(self, port: int) -> bool:
+        """Claim port; return False if it's already claimed, by any process."""
+        with self._lock:
+            if port in self._claimed:
+                return False
+            try:
+                fcntl.lockf(self._fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB, 1, port, os.SEEK_SET)
+            except OSError:
+                return False
+            self._claimed.add(port)
+            return True
+
+    def release(self, port: int) -> None:
+        """Release port claimed by this registry."""
+        with self._lock:
+            if port in self._claimed:
+                fcntl.lockf(self._fileno(), fcntl.LOCK_UN, 1, port, os.SEEK_SET)
+                self._claimed.discard(port)
+
+    def is_claimed(self, port: int) -> bool:
+        """Return if port is claimed, by this or any other process."""
+        if self.claim(port):
+            self.release(port)
+            return False
+        return True
+
+    @property
+    def claimed(self) -> frozenset[int]:
+        """Return ports claimed by this registry."""
+        return frozenset(self._claimed)
+
+    def close(self) -> None:
+        """Release all claims and close the registry file."""
+        with self._lock:
+            if self._fd is not None:
+                os.close(self._fd)
+                self._fd = None
+                self._claimed.clear()
+
+    def _fileno(self) -> int:
+        if self._fd is None:
+            raise PortForException(f"Registry {self.path} is closed")
+        return self._fd
+
+    def __enter__(self) -> "PortRegistry":
+        """Use registry as a context manager, closing it on exit."""
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        """Close the registry."""
+        self.close()
+
+
+def _default_path() -> str:
+    # resolved on first use: gettempdir() probes the filesystem, and may fail
+    import tempfile
+
+    return os.path.join(tempfile.gettempdir(), DEFAULT_REGISTRY_FILENAME)
@@ -0,0 +1,162 @@
+"""Snapshots of local TCP ports in use, read from the OS socket tables.
+
+A snapshot answers "is this port used?" for many ports at the cost of a
+single read, instead of connecting to and binding every candidate.
+
+Currently only Linux is supported, either through NETLINK_SOCK_DIAG or
+by parsing ``/proc/net/tcp`` and ``/proc/net/tcp6``.
+"""
+
+import os
+import socket
+import struct
+from typing import Iterable
+
+PROC_NET_TCP_PATHS = ("/proc/net/tcp", "/proc/net/tcp6")
+
+# linux/netlink.h, linux/sock_diag.h and linux/inet_diag.h
+NETLINK_SOCK_DIAG = 4
+SOCK_DIAG_BY_FAMILY = 20
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 0x2
+NLMSG_DONE = 0x3
+INET_DIAG_REQ_BYTECODE = 1
+INET_DIAG_BC_S_GE = 2
+INET_DIAG_BC_S_LE = 3
+ALL_TCP_STATES = 0xFFFFFFFF
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_NLATTR = struct.Struct("=HH")
+_BC_OP = struct.Struct("=BBH")
+# inet_diag_req_v2 without the trailing inet_diag_sockid, which is left zeroed
+_INET_DIAG_REQ = struct.Struct("=BBBBI")
+_INET_DIAG_SOCKID_SIZE = 48
+# offset of the (big endian) source port in inet_diag_msg
+_INET_DIAG_MSG_SPORT = 4
+
+
+class PortSnapshot:
+    """Local TCP ports that were in use when the snapshot was taken.
+
+    Every socket state counts (listening, established, time-wait...),
+    as each of them prevents binding to its local port.
+    """
+
+    def __init__(self, used_ports: Iterable[int]) -> None:
+        """Initialize PortSnapshot."""
+        self._used_ports = frozenset(used_ports)
+
+    @classmethod
+    def from_proc(cls, paths: Iterable[str] = PROC_NET_TCP_PATHS) -> "PortSnapshot":
+        """Read local ports of all sockets listed in ``/proc/net/tcp{,6}``.
+
+        :raises OSError: if none of the files can be read
+        """
+        used_ports: set[int] = set()
+        read_any = False
+        for path in paths:
+            try:
+                used_ports.update(_parse_proc_net_tcp(path))
+            except OSError:
+                # e.g. /proc/net/tcp6 is missing when IPv6 is disabled
+                continue
+            read_any = True
+        if not read_any:
+            raise OSError(f"Can't read any of {', '.join(paths)}")
+        return cls(used_ports)
+
+    @classmethod
+    def from_netlink(cls, low: int = 0, high: int = 65535) -> "PortSnapshot":
+        """Ask the kernel for TCP sockets with a local port between low and high.
+
+        Filtering happens in the kernel, so this stays fast on hosts with
+        a huge number of sockets. Ports outside of low..high are not
+        queried and therefore reported as unused.
+
+        :raises OSError: if NETLINK_SOCK_DIAG is not available,
+            e.g. on other platforms or in restricted containers
+        """
+        af_netlink = getattr(socket, "AF_NETLINK", None)
+        if af_netlink is None:
+            raise OSError("NETLINK_SOCK_DIAG is not supported on this platform")
+        used_ports: set[int] = set()
+        with socket.socket(af_netlink, socket.SOCK_RAW, NETLINK_SOCK_DIAG) as sock:
+            for family in (socket.AF_INET, socket.AF_INET6):
+                sock.send(_inet_diag_request(family, low, high))
+                used_ports.update(_receive_inet_diag_ports(sock))
+        return cls(used_ports)
+
+    @property
+    def used_ports(self) -> frozenset[int]:
+        """Return ports in use."""
+        return self._used_ports
+
+    def is_used(self, port: int) -> bool:
+        """Return if port was in use."""
+        return port in self._used_ports
+
+
+def take_snapshot(low: int = 0, high: int = 65535) -> PortSnapshot | None:
+    """Return a snapshot of ports used between low and high.
+
+    Tries netlink first, then ``/proc``, and returns None if the platform
+    can't provide a snapshot at all.
+    """
+    try:
+        return PortSnapshot.from_netlink(low, high)
+    except OSError:
+        pass
+    try:
+        return PortSnapshot.from_proc()
+    except OSError:
+        return None
+
+
+def _inet_diag_request(family: int, low: int, high: int) -> bytes:
+    # bytecode for "low <= sport and sport <= high"; the "no" jump of each
+    # comparison goes past the end of the program, which rejects the socket
+    bytecode = b"".join(
+        (
+            _BC_OP.pack(INET_DIAG_BC_S_GE, _BC_OP.size * 2, _BC_OP.size * 5),
+            _BC_OP.pack(0, 0, low),
+            _BC_OP.pack(INET_DIAG_BC_S_LE, _BC_OP.size * 2, _BC_OP.size * 3),
+            _BC_OP.pack(0, 0, high),
+        )
+    )
+    payload = (
+        _INET_DIAG_REQ.pack(family, socket.IPPROTO_TCP, 0, 0, ALL_TCP_STATES)
+        + bytes(_INET_DIAG_SOCKID_SIZE)
+        + _NLATTR.pack(_NLATTR.size + len(bytecode), INET_DIAG_REQ_BYTECODE)
+        + bytecode
+    )
+    header = _NLMSGHDR.pack(
+        _NLMSGHDR.size + len(payload), SOCK_DIAG_BY_FAMILY, NLM_F_REQUEST | NLM_F_DUMP, 1, 0
+    )
+    return header + payload
+
+
+def _receive_inet_diag_ports(sock: socket.socket) -> Iterable[int]:
+    ports: list[int] = []
+    while True:
+        data = sock.recv(65536)
+        offset = 0
+        while offset + _NLMSGHDR.size <= len(data):
+            length, msg_type = _NLMSGHDR.unpack_from(data, offset)[:2]
+            payload = offset + _NLMSGHDR.size
+            if msg_type == NLMSG_DONE:
+                return ports
+            if msg_type == NLMSG_ERROR:
+                (errno,) = struct.unpack_from("=i", data, payload)
+                raise OSError(-errno, os.strerror(-errno))
+            (port,) = struct.unpack_from("!H", data, payload + _INET_DIAG_MSG_SPORT)
+            ports.append(port)
+            # messages are 4 bytes aligned
+            offset += (length + 3) & ~3
+
+
+def _parse_proc_net_tcp(path: str) -> Iterable[int]:
+    with open(path) as f:
+        lines = f.readlines()
+    # first line is a header; second column is local_address as "HEXADDR:HEXPORT"
+    return [int(line.split()[1].rsplit(":", 1)[1], 16) for line in lines[1:] if line.strip()]
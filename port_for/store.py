@@ -1,82 +1,300 @@
 """PortStore implementation."""
 
 import os
-from configparser import DEFAULTSECT, ConfigParser
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, Mapping
 
-from .api import select_random
+from ._backends import Backend, BindingLease, Bindings, IniBackend, open_backend
+from .api import get_ports, select_random
 from .exceptions import PortForException
+from .probe import Prober
 
 DEFAULT_CONFIG_PATH = "/etc/port-for.conf"
 
 
 class PortStore:
-    """PortStore binds, reads and stores bound ports in config."""
+    """PortStore binds, reads and stores bound ports in config.
 
-    def __init__(self, config_filename: str = DEFAULT_CONFIG_PATH):
-        """Initialize PortStore."""
+    Bindings are stored in an INI file by default, or in an SQLite
+    database, safe to share between concurrent processes, when the path
+    ends with ``.db``, ``.sqlite`` or ``.sqlite3`` (or ``backend`` is "sqlite"),
+    or in an append-only journal, cheap to write to however many bindings
+    it holds, when the path ends with ``.journal`` (or ``backend`` is "journal").
+
+    Bindings may be leased: bound for ``ttl`` seconds, or for as long as
+    the process ``pid`` runs. :meth:`gc` unbinds the stale ones.
+    """
+
+    def __init__(
+        self,
+        config_filename: str = DEFAULT_CONFIG_PATH,
+        prober: Prober | None = None,
+        backend: str | None = None,
+        fsync: bool = False,
+    ):
+        """Initialize PortStore.
+
+        :param config_filename: config file ports are stored in
+        :param prober: probe ports to bind with it instead of the default prober
+        :param backend: "ini", "sqlite" or "journal"; guessed from config_filename by default
+        :param fsync: flush changes to disk before each transaction ends
+        """
         self._config = config_filename
+        self._prober = prober
+        self._backend: Backend = open_backend(config_filename, backend, fsync)
+        # bindings of the transaction open in the current thread, if any
+        self._local = threading.local()
+
+    @contextmanager
+    def transaction(self) -> Iterator["PortStore"]:
+        """Group changes made in the block into a single transaction.
+
+        The store is read once, when the block starts, and written once,
+        when it ends; nothing is written if the block raises. Other
+        writers wait until the transaction ends. Nested blocks join the
+        outer transaction.
+
+        >>> with store.transaction():  # doctest: +SKIP
+        ...     store.unbind_port("old")
+        ...     store.bind_port("new")
+        """
+        if self._active_bindings() is not None:
+            yield self
+            return
+        with self._backend.transaction() as bindings:
+            self._local.bindings = bindings
+            try:
+                yield self
+            finally:
+                self._local.bindings = None
+
+    def bind_port(
+        self,
+        app: str,
+        port: int | str | None = None,
+        ttl: float | None = None,
+        pid: int | None = None,
+    ) -> int:
+        """Binds port to app in the config.
+
+        With ttl or pid, the binding is leased, see :meth:`gc`; binding
+        an app again renews its lease.
+
+        :param ttl: seconds the binding lasts for
+        :param pid: process owning the binding; it lasts until the process exits
+        """
+        app = _normalize_app(app)
+        requested_port = None if port is None else int(port)
+        with self._bindings() as bindings:
+            return self._bind(bindings, app, requested_port, _lease(ttl, pid))
+
+    def bind_ports(
+        self,
+        ports: Mapping[str, int | str | None],
+        ttl: float | None = None,
+        pid: int | None = None,
+    ) -> dict[str, int]:
+        """Bind ports to many apps at once, in a single transaction.
+
+        Apps mapped to None get random ports, all selected at once by
+        :func:`port_for.get_ports`. Either all ports are bound,
+        or none if any of them conflicts with another binding.
+
+        :param ports: app => port to bind, or None for a random port
+        :param ttl: seconds the bindings last for, as in :meth:`bind_port`
+        :param pid: process owning the bindings, as in :meth:`bind_port`
+        :returns: app => bound port, app names lowercased
+        :raises PortForException: on conflicts, as :meth:`bind_port`
+        """
+        requested = {
+            _normalize_app(app): None if port is None else int(port) for app, port in ports.items()
+        }
+        lease = _lease(ttl, pid)
+        bound: dict[str, int] = {}
+        with self._bindings() as bindings:
+            pending = []
+            for app, port in requested.items():
+                if port is None and bindings.port_for_app(app) is None:
+                    pending.append(app)
+                else:
+                    bound[app] = self._bind(bindings, app, port, lease)
+
+            selected = get_ports(len(pending), prober=self._prober)
+            for app, port in zip(pending, selected):
+                if bindings.app_for_port(port) is not None:
+                    port = self._select_unbound(bindings, exclude_ports=selected)
+                bound[app] = self._bind(bindings, app, port, lease)
+        return {app: bound[app] for app in requested}
+
+    def unbind_port(self, app: str) -> None:
+        """Remove port assignement to application."""
+        with self._bindings() as bindings:
+            bindings.unbind(app.lower())
+
+    def bound_ports(self) -> list[tuple[str, int]]:
+        """List all bound ports."""
+        with self._reading() as bindings:
+            return list(bindings.items())
+
+    def port_for_app(self, app: str) -> int | None:
+        """Return port bound to app, or None; a lookup, not a scan of all bindings."""
+        with self._reading() as bindings:
+            return bindings.port_for_app(app.lower())
+
+    def app_for_port(self, port: int) -> str | None:
+        """Return app the port is bound to, or None; a lookup, not a scan of all bindings."""
+        with self._reading() as bindings:
+            return bindings.app_for_port(port)
 
-    def bind_port(self, app: str, port: int | str | None = None) -> int:
-        """Binds port to app in the config."""
-        if "=" in app or ":" in app:
-            raise Exception(f'invalid app name: "{app}"')
+    def lease_for_app(self, app: str) -> BindingLease | None:
+        """Return lease of the port bound to app, or None if it's not leased."""
+        with self._reading() as bindings:
+            return bindings.lease(app.lower())
 
-        requested_port: str | None = None
-        if port is not None:
-            requested_port = str(port)
+    def gc(self) -> list[tuple[str, int]]:
+        """Unbind apps whose lease expired, or whose owning process exited.
 
-        parser = self._get_parser()
+        Only leased bindings are checked, all in a single transaction.
+        Owners are looked up among processes of this machine; where that's
+        not possible (on Windows), only expiry is checked.
 
+        :returns: (app, port) pairs unbound
+        """
+        now = time.time()
+        with self._bindings() as bindings:
+            stale = [app for app, lease in bindings.leases() if _is_stale(lease, now)]
+            unbound = []
+            for app in stale:
+                port = bindings.port_for_app(app)
+                if port is not None:
+                    bindings.unbind(app)
+                    unbound.append((app, port))
+        return unbound
+
+    def import_ini(self, filename: str) -> int:
+        """Import bindings from an INI file, as written by the default backend.
+
+        Bindings already in the store are kept; all are imported, or none
+        if any of them conflicts with one in the store.
+
+        :returns: number of bindings imported
+        :raises PortForException: if an app or a port is already bound differently
+        """
+        if not os.path.exists(filename):
+            raise PortForException(f"No such file: {filename}")
+        with IniBackend(filename).read() as ini_bindings:
+            ini_items = list(ini_bindings.items())
+        imported = 0
+        with self._bindings() as bindings:
+            for app, port in ini_items:
+                if bindings.port_for_app(app) != port:
+                    self._bind(bindings, app, port)
+                    imported += 1
+        return imported
+
+    def _bind(
+        self,
+        bindings: Bindings,
+        app: str,
+        requested_port: int | None,
+        lease: BindingLease | None = None,
+    ) -> int:
         # this app already use some port; return it
-        if parser.has_option(DEFAULTSECT, app):
-            actual_port = parser.get(DEFAULTSECT, app)
+        actual_port = bindings.port_for_app(app)
+        if actual_port is not None:
             if requested_port is not None and requested_port != actual_port:
                 msg = (
                     f"Can't bind to port {requested_port}: "
                     f"{app} is already associated with port {actual_port}"
                 )
                 raise PortForException(msg)
-            return int(actual_port)
-
-        # port is already used by an another app
-        app_by_port = dict((v, k) for k, v in parser.items(DEFAULTSECT))
-        bound_port_numbers = map(int, app_by_port.keys())
+            if lease is not None:
+                bindings.set_lease(app, lease)
+            return actual_port
 
         if requested_port is None:
-            requested_port = str(select_random(exclude_ports=bound_port_numbers))
+            requested_port = self._select_unbound(bindings)
 
-        if requested_port in app_by_port:
-            binding_app = app_by_port[requested_port]
-            if binding_app != app:
-                raise PortForException(f"Port {requested_port} is already used by {binding_app}!")
+        # port is already used by an another app
+        binding_app = bindings.app_for_port(requested_port)
+        if binding_app is not None:
+            raise PortForException(f"Port {requested_port} is already used by {binding_app}!")
 
         # new app & new port
-        parser.set(DEFAULTSECT, app, requested_port)
-        self._save(parser)
+        bindings.bind(app, requested_port)
+        if lease is not None:
+            bindings.set_lease(app, lease)
+        return requested_port
 
-        return int(requested_port)
+    def _select_unbound(self, bindings: Bindings, exclude_ports: list[int] | None = None) -> int:
+        """Select a random port not bound to any app yet.
 
-    def unbind_port(self, app: str) -> None:
-        """Remove port assignement to application."""
-        parser = self._get_parser()
-        parser.remove_option(DEFAULTSECT, app)
-        self._save(parser)
+        Bound ports are looked up one by one as they are selected, instead
+        of excluding all of them up front, which costs O(number of bindings).
+        """
+        excluded = set(exclude_ports or ())
+        while True:
+            port = select_random(exclude_ports=excluded, prober=self._prober)
+            if bindings.app_for_port(port) is None:
+                return port
+            excluded.add(port)
 
-    def bound_ports(self) -> list[tuple[str, int]]:
-        """List all bound ports."""
-        return [(app, int(port)) for app, port in self._get_parser().items(DEFAULTSECT)]
-
-    def _ensure_config_exists(self) -> None:
-        if not os.path.exists(self._config):
-            with open(self._config, "w"):
-                pass
-
-    def _get_parser(self) -> ConfigParser:
-        self._ensure_config_exists()
-        parser = ConfigParser()
-        parser.read(self._config)
-        return parser
-
-    def _save(self, parser: ConfigParser) -> None:
-        with open(self._config, "w") as f:
-            parser.write(f)
+    def _active_bindings(self) -> Bindings | None:
+        return getattr(self._local, "bindings", None)
+
+    @contextmanager
+    def _bindings(self) -> Iterator[Bindings]:
+        """Give bindings of the open transaction, or of a new one."""
+        active = self._active_bindings()
+        if active is not None:
+            yield active
+            return
+        with self._backend.transaction() as bindings:
+            yield bindings
+
+    @contextmanager
+    def _reading(self) -> Iterator[Bindings]:
+        """Give bindings of the open transaction, or as last saved."""
+        active = self._active_bindings()
+        if active is not None:
+            yield active
+            return
+        with self._backend.read() as bindings:
+            yield bindings
+
+
+def _normalize_app(app: str) -> str:
+    if "=" in app or ":" in app:
+        raise Exception(f'invalid app name: "{app}"')
+    # app names are case insensitive, as options of INI files are
+    return app.lower()
+
+
+def _lease(ttl: float | None, pid: int | None) -> BindingLease | None:
+    if ttl is None and pid is None:
+        return None
+    return BindingLease(None if ttl is None else time.time() + ttl, pid)
+
+
+def _is_stale(lease: BindingLease, now: float) -> bool:
+    if lease.expires is not None and lease.expires <= now:
+        return True
+    return lease.pid is not None and not _process_exists(lease.pid)
+
+
+def _process_exists(pid: int) -> bool:
+    if sys.platform == "win32":
+        # os.kill() terminates the process there
+        return True
+    try:
+        # signal 0 checks the process exists, without signalling it
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # exists, owned by another user
+        return True
+    return True
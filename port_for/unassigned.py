@@ -0,0 +1,43 @@
+"""Bitmap of IANA unassigned and otherwise not well-known ports.
+
+The bitmap is generated by ``port_for._download_ranges`` together with
+``port_for._ranges`` and shipped as a 8192 bytes data file: bit N
+(least significant bit first) is set when port N is unassigned.
+"""
+
+import functools
+
+from .utils import PortRanges
+
+BITMAP_FILENAME = "_unassigned.bin"
+BITMAP_SIZE = 65536 // 8
+
+
+@functools.lru_cache(maxsize=None)
+def bitmap() -> bytes:
+    """Return the raw bitmap of unassigned ports."""
+    from importlib import resources
+
+    data = resources.files("port_for").joinpath(BITMAP_FILENAME).read_bytes()
+    if len(data) != BITMAP_SIZE:
+        raise ValueError(f"{BITMAP_FILENAME} should have {BITMAP_SIZE} bytes, got {len(data)}")
+    return data
+
+
+@functools.lru_cache(maxsize=None)
+def mask() -> int:
+    """Return the bitmap as an integer, bit N set meaning port N is unassigned."""
+    return int.from_bytes(bitmap(), "little")
+
+
+def is_unassigned(port: int) -> bool:
+    """Return if port is unassigned; a single bit lookup."""
+    if not 0 <= port < 65536:
+        return False
+    return bool(bitmap()[port >> 3] >> (port & 7) & 1)
+
+
+@functools.lru_cache(maxsize=None)
+def port_ranges() -> PortRanges:
+    """Return unassigned ports as ranges."""
+    return PortRanges.from_mask(mask())
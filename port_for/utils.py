@@ -1,7 +1,10 @@
 """Port for utils."""
 
 import itertools
-from typing import Iterable, Iterator
+import random
+from bisect import bisect_right
+from collections.abc import Set
+from typing import Any, Iterable, Iterator
 
 
 def ranges_to_set(lst: Iterable[tuple[int, int]]) -> set[int]:
@@ -26,3 +29,246 @@ def to_ranges(lst: Iterable[int]) -> Iterator[tuple[int, int]]:
     for a, b in itertools.groupby(enumerate(lst), lambda t: t[1] - t[0]):
         c = list(b)
         yield c[0][1], c[-1][1]
+
+
+class PortRanges(Set[int]):
+    """Immutable set of ports stored as sorted, disjoint, inclusive ranges.
+
+    Set operations between two ``PortRanges`` cost O(number of ranges)
+    instead of O(number of ports):
+
+    >>> a = PortRanges([(1, 10), (20, 30)])
+    >>> b = PortRanges([(5, 25)])
+    >>> (a & b).ranges
+    ((5, 10), (20, 25))
+    >>> (a - b).ranges
+    ((1, 4), (26, 30))
+    >>> (a | b).ranges
+    ((1, 30),)
+    >>> len(a), 7 in a, 15 in a
+    (21, True, False)
+
+    """
+
+    __slots__ = ("_ranges", "_lows", "_offsets", "_len")
+
+    def __init__(self, ranges: Iterable[tuple[int, int]] = ()) -> None:
+        """Initialize from (low, high) pairs; they may overlap or be unsorted."""
+        merged: list[tuple[int, int]] = []
+        for low, high in sorted(r for r in ranges if r[0] <= r[1]):
+            if merged and low <= merged[-1][1] + 1:
+                if high > merged[-1][1]:
+                    merged[-1] = (merged[-1][0], high)
+            else:
+                merged.append((low, high))
+        self._set_ranges(merged)
+
+    def _set_ranges(self, ranges: list[tuple[int, int]]) -> None:
+        self._ranges = tuple(ranges)
+        self._lows = [low for low, _ in ranges]
+        # number of ports in all preceding ranges
+        self._offsets = list(
+            itertools.accumulate((high - low + 1 for low, high in ranges), initial=0)
+        )
+        self._len = self._offsets.pop()
+
+    @classmethod
+    def _from_sorted(cls, ranges: list[tuple[int, int]]) -> "PortRanges":
+        """Build from already sorted, disjoint and non-adjacent ranges."""
+        obj = cls.__new__(cls)
+        obj._set_ranges(ranges)
+        return obj
+
+    @classmethod
+    def from_ports(cls, ports: Iterable[int]) -> "PortRanges":
+        """Build from an iterable of port numbers."""
+        if isinstance(ports, PortRanges):
+            return ports
+        return cls._from_sorted(list(to_ranges(sorted(set(ports)))))
+
+    @classmethod
+    def from_mask(cls, mask: int) -> "PortRanges":
+        """Build from an integer bitmap, where bit N set means port N is included.
+
+        >>> PortRanges.from_mask(0b1101110).ranges
+        ((1, 3), (5, 6))
+
+        """
+        ranges: list[tuple[int, int]] = []
+        offset = 0
+        while mask:
+            # skip to the lowest set bit, then measure the run of ones
+            zeros = (mask & -mask).bit_length() - 1
+            mask >>= zeros
+            ones = (mask ^ (mask + 1)).bit_length() - 1
+            mask >>= ones
+            ranges.append((offset + zeros, offset + zeros + ones - 1))
+            offset += zeros + ones
+        return cls._from_sorted(ranges)
+
+    def to_mask(self) -> int:
+        """Return an integer bitmap, where bit N set means port N is included.
+
+        >>> bin(PortRanges([(1, 3), (5, 6)]).to_mask())
+        '0b1101110'
+
+        """
+        mask = 0
+        for low, high in self._ranges:
+            mask |= ((1 << (high - low + 1)) - 1) << low
+        return mask
+
+    @classmethod
+    def _from_iterable(cls, it: Iterable[Any]) -> "PortRanges":  # type: ignore[override]
+        # used by the collections.abc.Set mixin methods
+        return cls.from_ports(it)
+
+    @property
+    def ranges(self) -> tuple[tuple[int, int], ...]:
+        """Return the (low, high) inclusive ranges, sorted."""
+        return self._ranges
+
+    def __contains__(self, port: object) -> bool:
+        """Check if port is in one of the ranges in O(log(number of ranges))."""
+        if not isinstance(port, int):
+            return False
+        idx = bisect_right(self._lows, port) - 1
+        return idx >= 0 and port <= self._ranges[idx][1]
+
+    def __iter__(self) -> Iterator[int]:
+        """Iterate over all ports in ascending order."""
+        return itertools.chain.from_iterable(range(low, high + 1) for low, high in self._ranges)
+
+    def __len__(self) -> int:
+        """Return number of ports."""
+        return self._len
+
+    def __bool__(self) -> bool:
+        """Return True if there is at least one port."""
+        return bool(self._ranges)
+
+    def __repr__(self) -> str:
+        """Return representation listing the ranges."""
+        return f"{self.__class__.__name__}({list(self._ranges)!r})"
+
+    def __eq__(self, other: object) -> bool:
+        """Compare with another PortRanges by ranges, or with any other set."""
+        if isinstance(other, PortRanges):
+            return self._ranges == other._ranges
+        return super().__eq__(other)
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def union(self, other: Iterable[int]) -> "PortRanges":
+        """Return ports that are in either set."""
+        other = PortRanges.from_ports(other)
+        return PortRanges(self._ranges + other._ranges)
+
+    def intersection(self, other: Iterable[int]) -> "PortRanges":
+        """Return ports that are in both sets."""
+        other = PortRanges.from_ports(other)
+        result: list[tuple[int, int]] = []
+        a, b = self._ranges, other._ranges
+        i = j = 0
+        while i < len(a) and j < len(b):
+            low = max(a[i][0], b[j][0])
+            high = min(a[i][1], b[j][1])
+            if low <= high:
+                result.append((low, high))
+            if a[i][1] < b[j][1]:
+                i += 1
+            else:
+                j += 1
+        return PortRanges._from_sorted(result)
+
+    def difference(self, other: Iterable[int]) -> "PortRanges":
+        """Return ports that are in this set but not in the other."""
+        other = PortRanges.from_ports(other)
+        result: list[tuple[int, int]] = []
+        b = other._ranges
+        j = 0
+        for low, high in self._ranges:
+            while j < len(b) and b[j][1] < low:
+                j += 1
+            k = j
+            while k < len(b) and b[k][0] <= high:
+                if b[k][0] > low:
+                    result.append((low, b[k][0] - 1))
+                low = b[k][1] + 1
+                k += 1
+            if low <= high:
+                result.append((low, high))
+        return PortRanges._from_sorted(result)
+
+    def port_at(self, index: int) -> int:
+        """Return index-th port, counting from the lowest one, in O(log(number of ranges)).
+
+        >>> PortRanges([(1, 3), (10, 12)]).port_at(4)
+        11
+
+        """
+        if not 0 <= index < self._len:
+            raise IndexError(f"Port index out of range: {index}")
+        idx = bisect_right(self._offsets, index) - 1
+        return self._ranges[idx][0] + index - self._offsets[idx]
+
+    def sample(self, count: int, exclude: Iterable[int] = ()) -> list[int]:
+        """Return up to count distinct random ports, none of them in exclude.
+
+        Ports are drawn by their rank, which weights each range by its
+        length; neither the ports nor the remaining (not excluded) ports
+        are materialized, so memory used is proportional to count
+        and exclude only.
+        """
+        excluded = {port for port in exclude if port in self}
+        draws = min(self._len, count + len(excluded))
+        ports = []
+        for index in random.sample(range(self._len), draws):
+            port = self.port_at(index)
+            if port not in excluded:
+                ports.append(port)
+                if len(ports) == count:
+                    break
+        return ports
+
+    def shard(self, index: int, count: int) -> "PortRanges":
+        """Return index-th of count disjoint parts of (nearly) equal size.
+
+        Parts are contiguous, so their ranges stay compact, and always
+        the same for the same ports:
+
+        >>> ports = PortRanges([(1, 5), (11, 15)])
+        >>> [ports.shard(i, 3).ranges for i in range(3)]
+        [((1, 3),), ((4, 5), (11, 11)), ((12, 15),)]
+
+        """
+        if not 0 <= index < count:
+            raise ValueError(f"Shard index should be between 0 and {count - 1}, got {index}")
+        start = self._len * index // count
+        stop = self._len * (index + 1) // count
+        result: list[tuple[int, int]] = []
+        for (low, high), offset in zip(self._ranges, self._offsets):
+            first = max(start - offset, 0)
+            last = min(stop - offset, high - low + 1) - 1
+            if first <= last:
+                result.append((low + first, low + last))
+        return PortRanges._from_sorted(result)
+
+    def complement(self, low: int = 0, high: int = 65535) -> "PortRanges":
+        """Return ports between low and high (inclusive) that are not in this set."""
+        return PortRanges([(low, high)]).difference(self)
+
+    def __or__(self, other: Iterable[Any]) -> "PortRanges":
+        """Return union."""
+        return self.union(other)
+
+    def __and__(self, other: Iterable[Any]) -> "PortRanges":
+        """Return intersection."""
+        return self.intersection(other)
+
+    def __sub__(self, other: Iterable[Any]) -> "PortRanges":
+        """Return difference."""
+        return self.difference(other)
+
+    __ror__ = __or__
+    __rand__ = __and__
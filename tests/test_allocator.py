@@ -0,0 +1,59 @@
+"""Tests for PortAllocator."""
+
+import threading
+import time
+
+from pytest import MonkeyPatch
+
+import port_for
+from port_for import PortAllocator
+
+
+def test_threads_get_distinct_ports(monkeypatch: MonkeyPatch) -> None:
+    """Concurrent threads never get the same port."""
+    monkeypatch.setattr(port_for.probe, "_default_prober", port_for.FakeProber())
+    allocator = PortAllocator()
+    results: list[int] = []
+    lock = threading.Lock()
+
+    def allocate() -> None:
+        for _ in range(10):
+            port = allocator.get_port((20000, 20099))
+            assert port is not None
+            with lock:
+                results.append(port)
+
+    threads = [threading.Thread(target=allocate) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results) == list(range(20000, 20100))
+    assert allocator.reserved == set(results)
+
+
+def test_release(monkeypatch: MonkeyPatch) -> None:
+    """Released ports can be handed out again."""
+    prober = port_for.FakeProber()
+    monkeypatch.setattr(port_for.probe, "_default_prober", prober)
+    allocator = PortAllocator()
+    port = allocator.select_random({8000, 8001})
+    other_port = allocator.select_random({8000, 8001})
+    assert {port, other_port} == {8000, 8001}
+    # reserved ports are not even probed
+    assert prober.probes == 2
+    allocator.release(port)
+    assert allocator.get_ports(1, [{8000, 8001}]) == [port]
+    assert allocator.get_port(1234) == 1234
+    assert allocator.reserved == {8000, 8001}
+
+
+def test_expiry(monkeypatch: MonkeyPatch) -> None:
+    """Reservations expire after ttl."""
+    monkeypatch.setattr(port_for.probe, "_default_prober", port_for.FakeProber())
+    allocator = PortAllocator(ttl=0.01)
+    port = allocator.select_random({8000})
+    assert allocator.reserved == {port}
+    time.sleep(0.02)
+    assert allocator.reserved == set()
+    assert allocator.select_random({8000}) == port
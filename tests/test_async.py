@@ -0,0 +1,51 @@
+"""Tests for asyncio counterparts of port_for functions."""
+
+import asyncio
+import socket
+
+import pytest
+from pytest import MonkeyPatch
+
+import port_for
+import port_for.aio
+
+
+def test_async_port_is_used() -> None:
+    """Listening ports are used, released ones are not."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen()
+        port = s.getsockname()[1]
+        assert asyncio.run(port_for.async_port_is_used(port))
+    assert not asyncio.run(port_for.async_port_is_used(port))
+
+
+def test_async_select_random(monkeypatch: MonkeyPatch) -> None:
+    """The only free port is selected."""
+    used = {1: True, 2: False, 3: True}
+
+    async def port_is_used(port: int) -> bool:
+        return used[port]
+
+    monkeypatch.setattr(port_for.aio, "async_port_is_used", port_is_used)
+    for _ in range(20):
+        assert asyncio.run(port_for.async_select_random({1, 2, 3}, concurrency=2)) == 2
+
+
+def test_async_all_used(monkeypatch: MonkeyPatch) -> None:
+    """Check behaviour if there are no ports to use."""
+
+    async def port_is_used(port: int) -> bool:
+        return True
+
+    monkeypatch.setattr(port_for.aio, "async_port_is_used", port_is_used)
+    with pytest.raises(port_for.PortForException):
+        asyncio.run(port_for.async_select_random())
+
+
+def test_async_get_port() -> None:
+    """async_get_port accepts the same specification as get_port."""
+    assert asyncio.run(port_for.async_get_port(None))
+    assert asyncio.run(port_for.async_get_port(-1)) is None
+    assert asyncio.run(port_for.async_get_port("1234")) == 1234
+    assert asyncio.run(port_for.async_get_port((2000, 3000))) in range(2000, 3001)
@@ -1,13 +1,15 @@
 """Test cases."""
 
 import socket
+import subprocess
 import sys
+from typing import Callable, Generator
 
 import pytest
 
 import port_for
 from port_for.api import get_port
-from port_for.utils import ranges_to_set
+from port_for.utils import PortRanges, ranges_to_set
 
 
 def test_common_ports() -> None:
@@ -105,6 +107,22 @@ def test_get_port_from_set(port_set: list[set[int]] | set[int]) -> None:
     assert get_port(port_set) in {4001, 4002, 4003}
 
 
+def test_get_port_from_port_ranges() -> None:
+    """Ports returned by available_good_ports() can be selected from."""
+    good_ports = port_for.available_good_ports()
+    assert get_port(good_ports) in good_ports
+    assert get_port([good_ports]) in good_ports
+    assert set(port_for.get_ports(3, good_ports)) <= good_ports
+    first, last = port_for.get_port_block(3, good_ports)
+    assert {first, last} <= good_ports
+    assert port_for.PortAllocator().get_port(good_ports) in good_ports
+    mixed: list[str | int | tuple[int, int] | set[int] | PortRanges] = [
+        (4000, 4001),
+        PortRanges([(5000, 5000)]),
+    ]
+    assert get_port(mixed) in {4000, 4001, 5000}
+
+
 def test_port_mix() -> None:
     """Test getting random port from given set and range."""
     sets_and_ranges: list[tuple[int, int] | set[int]] = [
@@ -117,3 +135,171 @@ def test_port_mix() -> None:
         4003,
     }
     assert get_port(sets_and_ranges) in want_set
+
+
+@pytest.fixture
+def set_ephemeral_ranges(
+    monkeypatch: pytest.MonkeyPatch,
+) -> Generator[Callable[[list[tuple[int, int]]], None], None, None]:
+    """Return a function faking the OS ephemeral port ranges.
+
+    Port models memoized for the fake ranges are forgotten afterwards,
+    even if the test fails.
+    """
+
+    def set_ranges(ranges: list[tuple[int, int]]) -> None:
+        monkeypatch.setattr(port_for.ephemeral, "_port_ranges", lambda: ranges)
+        # new ranges are picked up after ephemeral.CACHE_TTL, or right away after clear_cache()
+        port_for.clear_cache()
+
+    yield set_ranges
+    port_for.clear_cache()
+
+
+def test_models_follow_ephemeral_ranges(
+    set_ephemeral_ranges: Callable[[list[tuple[int, int]]], None],
+) -> None:
+    """Port models are memoized per ephemeral port ranges."""
+    set_ephemeral_ranges([(20000, 30000)])
+    assert port_for.available_good_ports() is port_for.available_good_ports()
+    assert 23600 not in port_for.available_ports()
+
+    set_ephemeral_ranges([(40000, 60000)])
+    assert 23600 in port_for.available_ports()
+    assert 49100 not in port_for.available_ports()
+    assert not port_for.is_available(49100)
+
+
+def test_available_ports_exclude_lists() -> None:
+    """Excluded ranges may be given as lists, as read from JSON or YAML."""
+    port = port_for.available_ports().port_at(0)
+    ports = port_for.available_ports(exclude_ranges=[[port, port + 10]])
+    assert ports == port_for.available_ports(exclude_ranges=[(port, port + 10)])
+    assert port not in ports
+
+
+def test_get_ports() -> None:
+    """Bulk allocation returns distinct ports."""
+    ports = port_for.get_ports(50)
+    assert len(set(ports)) == 50
+    assert port_for.get_ports(0) == []
+    assert port_for.get_ports(1, "1234") == [1234]
+    with pytest.raises(port_for.PortForException):
+        port_for.get_ports(2, 1234)
+
+
+def test_get_ports_exclude() -> None:
+    """Only ports not excluded are returned, from given range."""
+    ports = port_for.get_ports(
+        2, (8000, 8010), [8000, 8001, 8003, 8004, 8005, 8007, 8008, 8009, 8010], concurrency=4
+    )
+    assert sorted(ports) == [8002, 8006]
+    with pytest.raises(port_for.PortForException):
+        port_for.get_ports(3, (8000, 8010), [8000, 8001, 8003, 8004, 8005, 8007, 8008, 8009, 8010])
+
+
+def test_get_port_block() -> None:
+    """Block of consecutive available ports."""
+    first, last = port_for.get_port_block(10)
+    assert last - first == 9
+    assert all(port in port_for.available_good_ports() for port in range(first, last + 1))
+    assert port_for.get_port_block(3, (8000, 8010), exclude_ports=range(8000, 8008)) == (
+        8008,
+        8010,
+    )
+    with pytest.raises(port_for.PortForException):
+        port_for.get_port_block(4, (8000, 8010), exclude_ports=[8003, 8007])
+    for size in (0, -1):
+        with pytest.raises(ValueError):
+            port_for.get_port_block(size)
+
+
+def test_get_port_block_used_port() -> None:
+    """Blocks with a port in use are skipped."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen()
+        port = s.getsockname()[1]
+        for _ in range(20):
+            first, last = port_for.get_port_block(2, (port - 2, port + 2))
+            assert port not in (first, last)
+
+
+def test_get_port_sharded() -> None:
+    """Workers only get ports from their own shard."""
+    shards = [port_for.available_good_ports(shard=index, shards=4) for index in range(4)]
+    assert sum(len(shard) for shard in shards) == len(port_for.available_good_ports())
+    for index, shard in enumerate(shards):
+        assert port_for.get_port(None, shard=index, shards=4) in shard
+        assert port_for.select_random(shard=index, shards=4) in shard
+        assert set(port_for.get_ports(3, shard=index, shards=4)) <= shard
+    assert port_for.get_port((8000, 8003), shard=1, shards=2) in {8002, 8003}
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_check_ports(
+    set_ephemeral_ranges: Callable[[list[tuple[int, int]]], None], concurrency: int
+) -> None:
+    """Each port gets the status explaining why it's (not) available."""
+    set_ephemeral_ranges([(40000, 60000)])
+    with socket.socket() as listening, socket.socket() as bound:
+        listening.bind(("127.0.0.1", 23600))
+        listening.listen(1)
+        bound.bind(("127.0.0.1", 23601))
+        statuses = port_for.check_ports(
+            [80, 11211, 49100, 23600, 23601, 23602, 80], concurrency=concurrency
+        )
+
+    S = port_for.PortStatus
+    assert statuses == {
+        80: S.SYSTEM,
+        11211: S.ASSIGNED,
+        49100: S.EPHEMERAL,
+        23600: S.IN_USE_CONNECT,
+        23601: S.IN_USE_BIND,
+        23602: S.AVAILABLE,
+    }
+    assert list(statuses) == [80, 11211, 49100, 23600, 23601, 23602]
+
+
+def test_check_ports_prober(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Ports are probed by the given prober, or the default one."""
+    monkeypatch.setattr(port_for.probe, "_default_prober", port_for.probe._default_prober)
+    S = port_for.PortStatus
+    prober = port_for.FakeProber({23600})
+    assert port_for.check_ports([23600, 23601], prober=prober) == {
+        23600: S.IN_USE,
+        23601: S.AVAILABLE,
+    }
+
+    port_for.set_default_prober(port_for.FakeProber(range(65536)))
+    assert not port_for.is_available(23600)
+    assert port_for.check_ports([23600]) == {23600: S.IN_USE}
+
+
+def test_check_ports_invalid() -> None:
+    """Numbers out of the TCP port range are rejected."""
+    with pytest.raises(ValueError):
+        port_for.check_ports([65536])
+
+
+def test_lazy_subsystems() -> None:
+    """Importing port_for doesn't import stores, leases, the registry or asyncio."""
+    lazy = (
+        "asyncio",
+        "configparser",
+        "sqlite3",
+        "port_for._backends",
+        "port_for.aio",
+        "port_for.allocator",
+        "port_for.lease",
+        "port_for.registry",
+        "port_for.store",
+    )
+    code = f"import sys, port_for; print([m for m in {lazy!r} if m in sys.modules])"
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
+    assert port_for.PortStore.__module__ == "port_for.store"
+    assert port_for.reserve_port.__module__ == "port_for.lease"
@@ -0,0 +1,60 @@
+"""Tests for the port-for command-line utility."""
+
+import functools
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+import port_for
+from port_for import PortStore
+from port_for.cmd import main
+
+
+@pytest.fixture
+def store_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> str:
+    """Make port-for use a temporary store, and return its path."""
+    path = str(tmp_path / "ports.conf")
+    monkeypatch.setattr(port_for.cmd, "PortStore", functools.partial(PortStore, path))
+    return path
+
+
+def run(monkeypatch: pytest.MonkeyPatch, *args: str) -> None:
+    """Run port-for with args."""
+    monkeypatch.setattr(sys, "argv", ["port-for", *args])
+    main()
+
+
+def test_gc(
+    store_path: str, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Leased ports are bound with --ttl and --pid, and collected with --gc."""
+    run(monkeypatch, "expired", "--port", "8001", "--ttl", "-1")
+    run(monkeypatch, "--bind", "exited", "--port", "8002", "--pid", str(2**22 + 1))
+    run(monkeypatch, "mine", "--port", "8003", "--pid", str(os.getpid()))
+    run(monkeypatch, "forever", "--port", "8004")
+    assert capsys.readouterr().out == "8001\n8002\n8003\n8004\n"
+
+    run(monkeypatch, "--gc")
+    assert capsys.readouterr().out == "expired: 8001\nexited: 8002\n"
+    run(monkeypatch, "--list")
+    assert capsys.readouterr().out == "mine: 8003\nforever: 8004\n"
+    assert PortStore(store_path).lease_for_app("forever") is None
+
+
+@pytest.mark.parametrize(
+    "args",
+    [
+        ["--list", "--ttl", "60"],
+        ["--unbind", "foo", "--pid", "1"],
+        ["--gc", "--ttl", "60"],
+    ],
+)
+def test_lease_options_need_bind(
+    store_path: str, monkeypatch: pytest.MonkeyPatch, args: list[str]
+) -> None:
+    """--ttl and --pid are rejected unless a port is bound."""
+    with pytest.raises(SystemExit) as excinfo:
+        run(monkeypatch, *args)
+    assert excinfo.value.code == 2
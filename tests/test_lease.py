@@ -0,0 +1,74 @@
+"""Tests for port leases."""
+
+import socket
+import sys
+
+import pytest
+
+import port_for
+
+
+def test_reserve_port() -> None:
+    """Leased port stays used until released."""
+    with port_for.reserve_port() as lease:
+        assert repr(lease).endswith(" held>")
+        assert lease.host == "127.0.0.1"
+        assert lease.sock.getsockname()[1] == lease.port
+        assert lease.fileno() >= 0
+        assert port_for.port_is_used(lease.port)
+    assert lease.released
+    assert not port_for.port_is_used(lease.port)
+    with pytest.raises(port_for.PortForException):
+        lease.sock
+
+
+def test_reserve_port_from_set() -> None:
+    """Lease a port from given candidates, without altering them."""
+    free_port = port_for.select_random()
+    ports = {free_port}
+    with port_for.reserve_port(ports) as lease:
+        assert lease.port == free_port
+    assert ports == {free_port}
+    with pytest.raises(port_for.PortForException):
+        port_for.reserve_port(ports, exclude_ports=[free_port])
+
+
+def test_detach() -> None:
+    """Detached socket is handed over to the caller and can listen."""
+    lease = port_for.reserve_port()
+    with lease.detach() as sock:
+        assert lease.released
+        lease.release()
+        sock.listen()
+        with socket.create_connection(("127.0.0.1", lease.port)):
+            pass
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="SO_REUSEADDR semantics differ on Windows")
+def test_server_binds_while_lease_is_held() -> None:
+    """A server using SO_REUSEADDR can take over the port before the lease is released."""
+    with port_for.reserve_port() as lease:
+        with socket.socket() as server:
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            server.bind(("127.0.0.1", lease.port))
+            lease.release()
+            server.listen()
+
+
+def test_reserve_port_ipv6() -> None:
+    """Lease a port on an IPv6 address."""
+    if not socket.has_ipv6:
+        pytest.skip("IPv6 is not supported")
+    try:
+        lease = port_for.reserve_port(host="::1")
+    except OSError:
+        pytest.skip("IPv6 loopback is not available")
+    with lease:
+        assert lease.host == "::1"
+        assert lease.sock.family == socket.AF_INET6
+
+
+def test_reserve_port_bind_error() -> None:
+    """Errors other than the port being taken are raised right away."""
+    with pytest.raises(OSError):
+        port_for.reserve_port(host="192.0.2.1")
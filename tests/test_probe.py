@@ -0,0 +1,165 @@
+"""Tests for port_for.probe."""
+
+import socket
+from pathlib import Path
+from typing import Any, Generator
+
+import pytest
+from pytest import MonkeyPatch
+
+import port_for
+from port_for.snapshot import take_snapshot
+
+
+@pytest.fixture
+def listening_port() -> Generator[int, None, None]:
+    """Return a port something listens on."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen(1)
+        yield s.getsockname()[1]
+
+
+@pytest.fixture
+def no_sockets(monkeypatch: MonkeyPatch) -> None:
+    """Make opening any socket fail."""
+
+    def fail(*args: Any, **kwargs: Any) -> None:
+        raise AssertionError("A socket was opened")
+
+    monkeypatch.setattr(socket, "socket", fail)
+
+
+@pytest.mark.parametrize("prober", [port_for.ConnectBindProber(), port_for.BindProber()])
+def test_socket_probers(prober: port_for.Prober, listening_port: int) -> None:
+    """Probers opening sockets see a listening port as used."""
+    assert prober.is_used(listening_port)
+    assert port_for.port_is_used(listening_port, prober=prober)
+
+
+@pytest.mark.skipif(take_snapshot() is None, reason="Snapshots not supported")
+def test_snapshot_prober(listening_port: int) -> None:
+    """Snapshot prober sees a listening port as used, once the snapshot is refreshed."""
+    prober = port_for.SnapshotProber(max_age=0)
+    assert prober.is_used(listening_port)
+
+    prober = port_for.SnapshotProber(max_age=60)
+    snapshot = prober.snapshot()
+    assert prober.snapshot() is snapshot
+
+
+@pytest.mark.skipif(take_snapshot() is None, reason="Snapshots not supported")
+def test_snapshot_prober_selected_port_bind_checked() -> None:
+    """A port taken after the snapshot is not selected."""
+    prober = port_for.SnapshotProber(max_age=60)
+    prober.snapshot()
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen(1)
+        port = s.getsockname()[1]
+        assert not prober.is_used(port)
+        with pytest.raises(port_for.PortForException):
+            port_for.select_random({port}, prober=prober)
+        with pytest.raises(port_for.PortForException):
+            port_for.select_random({port}, prober=port_for.CachingProber(prober))
+
+
+def test_snapshot_prober_unsupported(monkeypatch: MonkeyPatch) -> None:
+    """Snapshot prober fails where snapshots are not supported."""
+    monkeypatch.setattr(port_for.probe, "take_snapshot", lambda: None)
+    with pytest.raises(port_for.PortForException):
+        port_for.SnapshotProber().is_used(8000)
+
+
+@pytest.mark.usefixtures("no_sockets")
+def test_fake_prober_select_random() -> None:
+    """Ports are selected with a fake prober without opening any socket."""
+    prober = port_for.FakeProber({1, 3})
+    for _ in range(20):
+        assert port_for.select_random({1, 2, 3}, prober=prober) == 2
+        assert port_for.get_port((1, 3), prober=prober) == 2
+    assert port_for.get_ports(1, {1, 2, 3}, prober=prober) == [2]
+    assert prober.probes > 40
+
+
+@pytest.mark.usefixtures("no_sockets")
+def test_default_prober(monkeypatch: MonkeyPatch) -> None:
+    """The default prober is used when none is passed."""
+    monkeypatch.setattr(port_for.probe, "_default_prober", port_for.probe._default_prober)
+    prober = port_for.FakeProber({23600})
+    port_for.set_default_prober(prober)
+    assert port_for.get_default_prober() is prober
+    assert port_for.port_is_used(23600)
+    assert not port_for.is_available(23600)
+    assert port_for.select_random({23600, 23601}) == 23601
+
+    port_for.set_default_prober(None)
+    assert isinstance(port_for.get_default_prober(), port_for.ConnectBindProber)
+
+
+def test_store_prober(tmp_path: Path) -> None:
+    """PortStore selects ports with its prober."""
+    prober = port_for.FakeProber()
+    store = port_for.PortStore(str(tmp_path / "store.cfg"), prober=prober)
+    store.bind_port("foo")
+    assert prober.probes == 1
+
+
+def test_caching_prober() -> None:
+    """Results are cached per host and port until they expire."""
+    fake = port_for.FakeProber({8000})
+    prober = port_for.CachingProber(fake, ttl=60)
+    for _ in range(3):
+        assert prober.is_used(8000)
+        assert not prober.is_used(8001)
+        assert not prober.is_used(8001, host="::1")
+    assert fake.probes == 3
+    assert prober.lookup(8000) is True
+    assert prober.lookup(8002) is None
+
+    prober.ttl = 0
+    assert prober.refresh(8000)
+    assert prober.lookup(8000) is None
+    prober.clear()
+    assert len(prober) == 0
+
+
+def test_caching_prober_lru() -> None:
+    """The least recently used results are dropped first."""
+    prober = port_for.CachingProber(port_for.FakeProber(), maxsize=2)
+    prober.is_used(1)
+    prober.is_used(2)
+    prober.is_used(1)
+    prober.is_used(3)
+    assert len(prober) == 2
+    assert prober.lookup(2) is None
+    assert prober.lookup(1) is False
+
+
+def test_caching_prober_verifies_selected_port() -> None:
+    """A port cached as free is probed again before being selected."""
+    fake = port_for.FakeProber({1, 3})
+    prober = port_for.CachingProber(fake, ttl=60)
+    for port in (1, 2, 3):
+        prober.is_used(port)
+    assert port_for.get_ports(1, {1, 2, 3}, prober=prober) == [2]
+    assert fake.probes == 4
+
+    fake.used_ports.add(2)
+    probes = fake.probes
+    with pytest.raises(port_for.PortForException):
+        port_for.select_random({1, 2, 3}, prober=prober)
+    # ports cached as used are not probed again
+    assert fake.probes == probes + 1
+    assert prober.lookup(2) is True
+
+
+def test_clear_cache_clears_default_caching_prober(monkeypatch: MonkeyPatch) -> None:
+    """clear_cache() forgets results cached by the default prober."""
+    monkeypatch.setattr(port_for.probe, "_default_prober", port_for.probe._default_prober)
+    prober = port_for.CachingProber(port_for.FakeProber())
+    port_for.set_default_prober(prober)
+    assert not port_for.port_is_used(8000)
+    assert len(prober) == 1
+    port_for.clear_cache()
+    assert len(prober) == 0
@@ -0,0 +1,91 @@
+"""Tests for PortRegistry."""
+
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+from pytest import MonkeyPatch
+
+import port_for
+from port_for import PortRegistry
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="Requires fcntl")
+
+CLAIMING_PROCESS = """
+import sys
+from port_for import PortRegistry
+registry = PortRegistry(sys.argv[1])
+assert registry.claim(int(sys.argv[2]))
+print("claimed", flush=True)
+sys.stdin.read()
+"""
+
+
+@pytest.fixture
+def registry(tmp_path: Path) -> PortRegistry:
+    """Open a registry in a temporary file."""
+    return PortRegistry(str(tmp_path / "registry"))
+
+
+def test_claim_release(registry: PortRegistry) -> None:
+    """Ports can be claimed once until released."""
+    assert registry.claim(8000)
+    assert not registry.claim(8000)
+    assert registry.is_claimed(8000)
+    assert registry.claimed == {8000}
+    registry.release(8000)
+    assert not registry.is_claimed(8000)
+    assert registry.claim(8000)
+    registry.close()
+    with pytest.raises(port_for.PortForException):
+        registry.claim(8001)
+
+
+def test_claim_released_on_exit(registry: PortRegistry) -> None:
+    """Ports claimed by another process are free once it exits."""
+    with subprocess.Popen(
+        [sys.executable, "-c", CLAIMING_PROCESS, registry.path, "8000"],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        text=True,
+        cwd=Path(__file__).parent.parent,
+    ) as process:
+        assert process.stdout is not None
+        assert process.stdout.readline().strip() == "claimed"
+        assert not registry.claim(8000)
+        assert registry.is_claimed(8000)
+        process.communicate()
+    assert registry.claim(8000)
+
+
+def test_select_random_claims(registry: PortRegistry, monkeypatch: MonkeyPatch) -> None:
+    """select_random skips claimed ports and claims the selected one."""
+    monkeypatch.setattr(port_for.probe, "_default_prober", port_for.FakeProber({3}))
+    assert registry.claim(1)
+    for _ in range(10):
+        assert port_for.select_random({1, 2, 3}, registry=registry) == 2
+        assert registry.claimed == {1, 2}
+        with pytest.raises(port_for.PortForException):
+            port_for.select_random({1, 2, 3}, registry=registry)
+        registry.release(2)
+
+
+def test_get_ports_claims(registry: PortRegistry) -> None:
+    """Ports returned by get_ports and get_port are claimed."""
+    ports = port_for.get_ports(5, registry=registry, concurrency=4)
+    assert registry.claimed >= set(ports)
+    assert port_for.get_port(None, exclude_ports=ports, registry=registry) not in ports
+
+
+def test_default_path(tmp_path: Path, monkeypatch: MonkeyPatch) -> None:
+    """Registry is in $PORT_FOR_REGISTRY, or in the temp directory, looked up when opened."""
+    monkeypatch.delenv(port_for.registry.REGISTRY_PATH_ENV, raising=False)
+    monkeypatch.setattr(tempfile, "tempdir", str(tmp_path))
+    with PortRegistry() as registry:
+        assert registry.path == str(tmp_path / "port-for.registry")
+
+    monkeypatch.setenv(port_for.registry.REGISTRY_PATH_ENV, str(tmp_path / "env.registry"))
+    with PortRegistry() as registry:
+        assert registry.path == str(tmp_path / "env.registry")
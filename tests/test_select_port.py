@@ -1,14 +1,45 @@
 """Tests for port_for.select_random."""
 
+import time
+from typing import Iterable
+
 import pytest
 from pytest import MonkeyPatch
 
 import port_for
+from port_for.probe import PROBE_TIMEOUT
+from port_for.snapshot import PortSnapshot
+
+ALL_PORTS = range(65536)
+
+
+class RecordingProber(port_for.FakeProber):
+    """Fake prober remembering the ports probed, and their timeouts."""
+
+    def __init__(self, used_ports: Iterable[int] = (), delay: float = 0.0) -> None:
+        """Initialize RecordingProber; probes take delay seconds, at most their timeout."""
+        super().__init__(used_ports)
+        self.delay = delay
+        self.probed: list[int] = []
+        self.timeouts: list[float] = []
+
+    def is_used(self, port: int, host: str = "127.0.0.1", timeout: float = PROBE_TIMEOUT) -> bool:
+        """Record the probe, then return if port is in used_ports."""
+        self.probed.append(port)
+        self.timeouts.append(timeout)
+        if self.delay:
+            time.sleep(min(timeout, self.delay))
+        return super().is_used(port, host, timeout)
+
+
+def use_prober(monkeypatch: MonkeyPatch, prober: port_for.Prober) -> None:
+    """Make prober the default one for the test."""
+    monkeypatch.setattr(port_for.probe, "_default_prober", prober)
 
 
 def test_all_used(monkeypatch: MonkeyPatch) -> None:
     """Check behaviour if there are no ports to use."""
-    monkeypatch.setattr(port_for.api, "port_is_used", lambda port: True)
+    use_prober(monkeypatch, port_for.FakeProber(ALL_PORTS))
     with pytest.raises(port_for.PortForException):
         port_for.select_random()
 
@@ -16,8 +47,99 @@ def test_all_used(monkeypatch: MonkeyPatch) -> None:
 def test_random_port(monkeypatch: MonkeyPatch) -> None:
     """Test random ports."""
     ports = {1, 2, 3}
-    used = {1: True, 2: False, 3: True}
-    monkeypatch.setattr(port_for.api, "port_is_used", lambda port: used[port])
+    use_prober(monkeypatch, port_for.FakeProber({1, 3}))
 
     for x in range(100):
         assert port_for.select_random(ports) == 2
+
+
+def test_random_port_concurrent(monkeypatch: MonkeyPatch) -> None:
+    """Probing candidates in threads finds the only free port."""
+    ports = set(range(1, 51))
+    use_prober(monkeypatch, port_for.FakeProber(ports - {42}))
+
+    for x in range(20):
+        assert port_for.select_random(set(ports), concurrency=8) == 42
+
+
+def test_all_used_concurrent(monkeypatch: MonkeyPatch) -> None:
+    """Check behaviour if there are no ports to use with concurrent probing."""
+    use_prober(monkeypatch, port_for.FakeProber(ALL_PORTS))
+    with pytest.raises(port_for.PortForException):
+        port_for.select_random(concurrency=8)
+
+
+def test_ports_not_modified(monkeypatch: MonkeyPatch) -> None:
+    """Ports passed to select_random are left intact."""
+    use_prober(monkeypatch, port_for.FakeProber())
+    ports = {1, 2, 3}
+    assert port_for.select_random(ports, exclude_ports=[1, 3]) == 2
+    assert ports == {1, 2, 3}
+
+
+def test_adaptive_finds_last_free_port(monkeypatch: MonkeyPatch) -> None:
+    """Adaptive search goes on past the random sample until a free port is found."""
+    ports = set(range(20000, 25000))
+    monkeypatch.setattr(port_for.api, "take_snapshot", lambda low, high: None)
+    use_prober(monkeypatch, port_for.FakeProber(ports - {24242}))
+
+    assert port_for.select_random(ports, adaptive=True) == 24242
+
+
+def test_adaptive_scan_skips_ports_used_in_snapshot(monkeypatch: MonkeyPatch) -> None:
+    """The full scan only probes ports not found in use by the snapshot."""
+    ports = set(range(20000, 25000))
+    prober = RecordingProber(ports - {24242})
+    use_prober(monkeypatch, prober)
+    snapshot = PortSnapshot(ports - {24242})
+    monkeypatch.setattr(port_for.api, "take_snapshot", lambda low, high: snapshot)
+
+    assert port_for.select_random(ports, adaptive=True) == 24242
+    assert len(prober.probed) <= 1 + sum(port_for.api.MAX_PROBES * 2**i for i in range(4))
+
+
+def test_adaptive_all_used(monkeypatch: MonkeyPatch) -> None:
+    """Adaptive search fails once every candidate was found used."""
+    prober = RecordingProber(ALL_PORTS)
+    use_prober(monkeypatch, prober)
+    monkeypatch.setattr(port_for.api, "take_snapshot", lambda low, high: None)
+    with pytest.raises(port_for.PortForException, match="all candidates are in use"):
+        port_for.select_random(set(range(20000, 23000)), exclude_ports=[20000], adaptive=True)
+    assert sorted(prober.probed) == list(range(20001, 23000))
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_deadline(monkeypatch: MonkeyPatch, concurrency: int) -> None:
+    """No more candidates are probed once the deadline passes."""
+    use_prober(monkeypatch, RecordingProber(ALL_PORTS, delay=0.01))
+    start = time.monotonic()
+    with pytest.raises(port_for.PortForException, match="within 0.05 seconds"):
+        port_for.select_random(adaptive=True, deadline=0.05, concurrency=concurrency)
+    assert time.monotonic() - start < 0.5
+
+
+def test_probes_share_deadline(monkeypatch: MonkeyPatch) -> None:
+    """No probe waits past the deadline, even with a longer timeout."""
+    prober = RecordingProber(ALL_PORTS, delay=0.02)
+    use_prober(monkeypatch, prober)
+    with pytest.raises(port_for.PortForException):
+        port_for.get_port(None, timeout=5, deadline=0.1)
+    assert prober.timeouts
+    assert all(timeout <= 0.1 for timeout in prober.timeouts)
+    assert prober.timeouts[-1] < prober.timeouts[0]
+
+
+def test_timeout_passed_to_probes(monkeypatch: MonkeyPatch) -> None:
+    """Each probe gets the timeout when there's no deadline."""
+    prober = RecordingProber({1, 3})
+    use_prober(monkeypatch, prober)
+    assert port_for.get_port({1, 2, 3}, timeout=0.25) == 2
+    assert set(prober.timeouts) == {0.25}
+
+
+def test_connect_timeout() -> None:
+    """Connecting to a host that doesn't answer gives up after timeout."""
+    start = time.monotonic()
+    # TEST-NET-1 address, never routed
+    assert not port_for.probe._accepts_connection(9, "192.0.2.1", timeout=0.2)
+    assert time.monotonic() - start < 1
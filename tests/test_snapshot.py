@@ -0,0 +1,77 @@
+"""Tests for port_for.snapshot."""
+
+import socket
+import sys
+from pathlib import Path
+
+import pytest
+
+import port_for
+from port_for.snapshot import PortSnapshot, take_snapshot
+
+linux_only = pytest.mark.skipif(sys.platform != "linux", reason="Reads /proc/net/tcp")
+
+PROC_NET_TCP = """\
+  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 00000000:1F90 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 1 1
+   1: 0100007F:BC8F 0100007F:1F90 01 00000000:00000000 00:00000000 00000000  1000        0 2 1
+"""
+
+
+def test_from_proc(tmp_path: Path) -> None:
+    """Local ports of every listed socket are used."""
+    path = tmp_path / "tcp"
+    path.write_text(PROC_NET_TCP)
+    snapshot = PortSnapshot.from_proc([str(path), str(tmp_path / "missing")])
+    assert snapshot.used_ports == {8080, 48271}
+    assert port_for.port_is_used(8080, snapshot=snapshot)
+    assert not port_for.port_is_used(8081, snapshot=snapshot)
+
+
+def test_from_proc_unreadable(tmp_path: Path) -> None:
+    """Snapshot can't be taken without any socket table."""
+    with pytest.raises(OSError):
+        PortSnapshot.from_proc([str(tmp_path / "missing")])
+
+
+@linux_only
+def test_snapshot_sees_listening_socket() -> None:
+    """Bound and listening sockets show up in a snapshot."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen()
+        port = s.getsockname()[1]
+        snapshot = take_snapshot()
+        assert snapshot is not None
+        assert snapshot.is_used(port)
+        free_port = port_for.select_random()
+        assert port_for.select_random({port, free_port}, use_snapshot=True) == free_port
+
+
+@linux_only
+def test_from_netlink_filters_range() -> None:
+    """Netlink snapshot only contains ports from the requested range."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        s.listen()
+        port = s.getsockname()[1]
+        try:
+            snapshot = PortSnapshot.from_netlink(port, port)
+        except OSError:
+            pytest.skip("NETLINK_SOCK_DIAG is not available")
+        assert snapshot.used_ports == {port}
+        assert not PortSnapshot.from_netlink(port + 1, 65535).is_used(port)
+
+
+def test_take_snapshot_fallback(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Without netlink, snapshot comes from /proc; without both there's none."""
+
+    def unavailable(*args: object) -> PortSnapshot:
+        raise OSError("unavailable")
+
+    monkeypatch.setattr(PortSnapshot, "from_netlink", unavailable)
+    if sys.platform == "linux":
+        assert take_snapshot() is not None
+    monkeypatch.setattr(PortSnapshot, "from_proc", unavailable)
+    assert take_snapshot() is None
+    assert port_for.select_random(use_snapshot=True)
@@ -1,5 +1,14 @@
 """Tests for PortStore."""
 
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+from contextlib import closing
+from pathlib import Path
 from typing import Generator
 
 import pytest
@@ -7,14 +16,16 @@ from pytest import TempPathFactory
 
 import port_for
 from port_for import PortStore
+from port_for._backends import JournalBackend
 
 
-@pytest.fixture
+@pytest.fixture(params=["port_store.cfg", "port_store.sqlite", "port_store.journal"])
 def port_store(
+    request: pytest.FixtureRequest,
     tmp_path_factory: TempPathFactory,
 ) -> Generator[PortStore, None, None]:
-    """Create an initialized port store."""
-    store_path = tmp_path_factory.mktemp("port_store") / "port_store.cfg"
+    """Create an initialized port store, for each backend."""
+    store_path = tmp_path_factory.mktemp("port_store") / request.param
     yield PortStore(str(store_path))
 
 
@@ -63,3 +74,358 @@ def test_bind_non_auto(port_store: PortStore) -> None:
     port = port_for.select_random()
     res_port = port_store.bind_port("foo", port)
     assert res_port == port
+
+
+def test_app_names_case_insensitive(port_store: PortStore) -> None:
+    """App names are stored lowercased."""
+    port = port_store.bind_port("Foo")
+    assert port_store.bind_port("FOO") == port
+    assert port_store.bound_ports() == [("foo", port)]
+
+
+@pytest.mark.parametrize(
+    "filename, backend, expected",
+    [
+        ("ports.conf", None, "IniBackend"),
+        ("ports.db", None, "SqliteBackend"),
+        ("ports.sqlite3", None, "SqliteBackend"),
+        ("ports.conf", "sqlite", "SqliteBackend"),
+        ("ports.journal", None, "JournalBackend"),
+        ("ports.conf", "journal", "JournalBackend"),
+    ],
+)
+def test_backend_selection(
+    tmp_path: Path, filename: str, backend: str | None, expected: str
+) -> None:
+    """Backend is chosen by name, or by path suffix."""
+    store = PortStore(str(tmp_path / filename), backend=backend)
+    assert type(store._backend).__name__ == expected
+
+
+def test_unknown_backend(tmp_path: Path) -> None:
+    """Unknown backends are rejected."""
+    with pytest.raises(port_for.PortForException):
+        PortStore(str(tmp_path / "ports.conf"), backend="xml")
+
+
+def test_concurrent_binds(port_store: PortStore) -> None:
+    """Concurrent writers don't lose each other's bindings."""
+    path = port_store._config
+    prober = port_for.FakeProber()
+
+    def bind(app: str) -> int:
+        return PortStore(path, prober=prober).bind_port(app)
+
+    apps = [f"app{i}" for i in range(40)]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        ports = list(executor.map(bind, apps))
+
+    assert len(set(ports)) == len(apps)
+    assert sorted(PortStore(path).bound_ports()) == sorted(zip(apps, ports))
+
+
+def test_sqlite_wal(tmp_path: Path) -> None:
+    """SQLite databases are in WAL mode, so readers don't block the writer."""
+    path = str(tmp_path / "ports.sqlite")
+    PortStore(path).bind_port("foo", 8001)
+    with closing(sqlite3.connect(path)) as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+
+def test_import_ini(tmp_path: Path) -> None:
+    """Bindings of INI files can be imported."""
+    ini_store = PortStore(str(tmp_path / "ports.conf"))
+    ini_store.bind_port("foo", 8001)
+    ini_store.bind_port("bar", 8002)
+    store = PortStore(str(tmp_path / "ports.sqlite"))
+    store.bind_port("foo", 8001)
+
+    assert store.import_ini(str(tmp_path / "ports.conf")) == 1
+    assert store.bound_ports() == [("foo", 8001), ("bar", 8002)]
+
+    ini_store.bind_port("baz", 8003)
+    store.bind_port("other", 8003)
+    with pytest.raises(port_for.PortForException):
+        store.import_ini(str(tmp_path / "ports.conf"))
+    assert store.bound_ports() == [("foo", 8001), ("bar", 8002), ("other", 8003)]
+
+    with pytest.raises(port_for.PortForException):
+        store.import_ini(str(tmp_path / "missing.conf"))
+
+
+def test_ini_replaced_atomically(tmp_path: Path) -> None:
+    """INI file is replaced by a new one, keeping its permissions."""
+    path = tmp_path / "ports.conf"
+    store = PortStore(str(path))
+    store.bind_port("foo", 8001)
+    path.chmod(0o640)
+    inode = path.stat().st_ino
+
+    store.bind_port("bar", 8002)
+    assert path.stat().st_ino != inode
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ports.conf", "ports.conf.lock"]
+
+
+@pytest.mark.skipif(
+    sys.platform == "win32" or os.geteuid() != 0, reason="Requires changing file owners"
+)
+def test_ini_replaced_keeping_owner(tmp_path: Path) -> None:
+    """INI file replaced by root keeps its owner and group."""
+    path = tmp_path / "ports.conf"
+    store = PortStore(str(path))
+    store.bind_port("foo", 8001)
+    os.chown(path, 65534, 65534)
+
+    store.bind_port("bar", 8002)
+    assert (path.stat().st_uid, path.stat().st_gid) == (65534, 65534)
+
+
+def test_ini_directory_not_writable(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Where only the INI file is writable, it's locked and rewritten in place."""
+    path = tmp_path / "ports.conf"
+    store = PortStore(str(path))
+    store.bind_port("foo", 8001)
+    (tmp_path / "ports.conf.lock").unlink()
+    inode = path.stat().st_ino
+    os_open = os.open
+
+    def no_new_files(file: str, flags: int, *args: int) -> int:
+        if flags & os.O_CREAT:
+            raise PermissionError(file)
+        return os_open(file, flags, *args)
+
+    def no_mkstemp(*args: object, **kwargs: object) -> None:
+        raise PermissionError(str(tmp_path))
+
+    monkeypatch.setattr(os, "open", no_new_files)
+    monkeypatch.setattr(tempfile, "mkstemp", no_mkstemp)
+    store.bind_port("bar", 8002)
+    store.unbind_port("foo")
+
+    assert path.stat().st_ino == inode
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["ports.conf"]
+    assert PortStore(str(path)).bound_ports() == [("bar", 8002)]
+
+
+def test_ini_cached(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """INI file is parsed again only once it changes."""
+    path = tmp_path / "ports.conf"
+    store = PortStore(str(path))
+    store.bind_port("foo", 8001)
+    reads = []
+    read = ConfigParser.read
+
+    def counting_read(self: ConfigParser, filenames: str) -> list[str]:
+        reads.append(filenames)
+        return read(self, filenames)
+
+    monkeypatch.setattr(ConfigParser, "read", counting_read)
+    for _ in range(10):
+        assert store.bound_ports() == [("foo", 8001)]
+    assert not reads
+
+    PortStore(str(path)).bind_port("bar", 8002)
+    assert store.bound_ports() == [("foo", 8001), ("bar", 8002)]
+    assert len(reads) == 2
+
+
+def test_lookups(port_store: PortStore) -> None:
+    """Apps and ports are looked up both ways."""
+    port_store.bind_port("foo", 8001)
+    assert port_store.port_for_app("foo") == 8001
+    assert port_store.port_for_app("FOO") == 8001
+    assert port_store.app_for_port(8001) == "foo"
+    assert port_store.port_for_app("bar") is None
+    assert port_store.app_for_port(8002) is None
+
+    port_store.unbind_port("foo")
+    assert port_store.port_for_app("foo") is None
+    assert port_store.app_for_port(8001) is None
+
+
+def test_bind_skips_bound_ports(port_store: PortStore, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Randomly selected ports bound to other apps are skipped."""
+    port_store.bind_port("foo", 8001)
+    port_store.bind_port("bar", 8002)
+
+    def select_random(exclude_ports: set[int], prober: port_for.Prober | None) -> int:
+        return min({8001, 8002, 8003} - exclude_ports)
+
+    monkeypatch.setattr(port_for.store, "select_random", select_random)
+    assert port_store.bind_port("baz") == 8003
+
+
+def test_transaction(port_store: PortStore) -> None:
+    """Changes made in a transaction are visible in it, and saved at its end."""
+    port_store.bind_port("old", 8001)
+    with port_store.transaction() as store:
+        store.unbind_port("old")
+        store.bind_port("new", 8001)
+        with store.transaction():
+            store.bind_port("newer", 8002)
+        assert store.bound_ports() == [("new", 8001), ("newer", 8002)]
+        assert store.app_for_port(8001) == "new"
+    assert PortStore(port_store._config).bound_ports() == [("new", 8001), ("newer", 8002)]
+
+
+def test_transaction_rollback(port_store: PortStore) -> None:
+    """Nothing is saved if a transaction raises."""
+    port_store.bind_port("foo", 8001)
+    with pytest.raises(port_for.PortForException):
+        with port_store.transaction():
+            port_store.unbind_port("foo")
+            port_store.bind_port("bar", 8002)
+            port_store.bind_port("baz", 8002)
+    assert port_store.bound_ports() == [("foo", 8001)]
+    assert PortStore(port_store._config).bound_ports() == [("foo", 8001)]
+
+
+def test_ini_transaction_writes_once(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """INI file is written once per transaction."""
+    store = PortStore(str(tmp_path / "ports.conf"), prober=port_for.FakeProber())
+    replaced = []
+    replace = os.replace
+
+    def counting_replace(src: str, dst: str) -> None:
+        replaced.append(dst)
+        replace(src, dst)
+
+    monkeypatch.setattr(os, "replace", counting_replace)
+    with store.transaction():
+        for i in range(20):
+            store.bind_port(f"app{i}")
+    assert len(replaced) == 1
+    assert len(store.bound_ports()) == 20
+
+
+def test_bind_ports(port_store: PortStore) -> None:
+    """Many apps get ports at once."""
+    port_store._prober = port_for.FakeProber()
+    port_store.bind_port("foo", 8001)
+    bound = port_store.bind_ports({"Foo": None, "bar": 8002, "baz": None, "qux": None})
+    assert list(bound) == ["foo", "bar", "baz", "qux"]
+    assert bound["foo"] == 8001
+    assert bound["bar"] == 8002
+    assert len(set(bound.values())) == 4
+    assert dict(port_store.bound_ports()) == bound
+
+
+def test_bind_ports_conflict(port_store: PortStore) -> None:
+    """No port is bound if any of them conflicts."""
+    port_store.bind_port("foo", 8001)
+    with pytest.raises(port_for.PortForException):
+        port_store.bind_ports({"bar": None, "baz": 8001})
+    assert port_store.bound_ports() == [("foo", 8001)]
+
+
+def test_journal_appends(tmp_path: Path) -> None:
+    """Journal gets a record per change, replayed by other stores."""
+    path = tmp_path / "ports.journal"
+    store = PortStore(str(path), fsync=True)
+    store.bind_port("foo", 8001)
+    store.bind_port("bar", 8002)
+    store.unbind_port("foo")
+    store.unbind_port("missing")
+    lines = path.read_bytes().splitlines()
+    assert lines[1:] == [b'["bind", "foo", 8001]', b'["bind", "bar", 8002]', b'["unbind", "foo"]']
+
+    other = PortStore(str(path))
+    assert other.bound_ports() == [("bar", 8002)]
+    store.bind_port("baz", 8003)
+    assert other.bound_ports() == [("bar", 8002), ("baz", 8003)]
+
+
+def test_journal_compaction(tmp_path: Path) -> None:
+    """Journal is compacted once it holds enough records more than bindings."""
+    path = str(tmp_path / "ports.journal")
+    backend = JournalBackend(path, compact_after=10)
+    other = PortStore(path)
+    for i in range(5):
+        with backend.transaction() as bindings:
+            bindings.bind("foo", 8000 + i)
+            bindings.unbind("foo")
+        other.port_for_app("foo")
+    with backend.transaction() as bindings:
+        bindings.bind("foo", 8001)
+
+    with open(path, "rb") as f:
+        assert f.read().splitlines()[1:] == [b'["bind", "foo", 8001]']
+    assert other.bound_ports() == [("foo", 8001)]
+    other.bind_port("bar", 8002)
+    assert PortStore(path).bound_ports() == [("foo", 8001), ("bar", 8002)]
+
+
+def test_journal_partial_record(tmp_path: Path) -> None:
+    """A record left half written is ignored, then dropped by the next writer."""
+    path = tmp_path / "ports.journal"
+    store = PortStore(str(path))
+    store.bind_port("foo", 8001)
+    with path.open("ab") as f:
+        f.write(b'["bind", "ba')
+
+    other = PortStore(str(path))
+    assert other.bound_ports() == [("foo", 8001)]
+    other.bind_port("bar", 8002)
+    assert store.bound_ports() == [("foo", 8001), ("bar", 8002)]
+    assert b'"ba\n' not in path.read_bytes()
+
+
+def test_journal_corrupted(tmp_path: Path) -> None:
+    """A journal that can't be replayed is reported."""
+    path = tmp_path / "ports.journal"
+    path.write_bytes(b'["bind", "foo", 8001]\n')
+    with pytest.raises(port_for.PortForException):
+        PortStore(str(path)).bound_ports()
+
+    PortStore(str(path), backend="journal")
+    path.unlink()
+    PortStore(str(path)).bind_port("foo", 8001)
+    with path.open("ab") as f:
+        f.write(b"garbage\n")
+    with pytest.raises(port_for.PortForException):
+        PortStore(str(path)).bound_ports()
+
+
+def test_gc(port_store: PortStore, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Expired bindings, and those of exited processes, are collected."""
+    port_store.bind_port("forever", 8001)
+    port_store.bind_port("expired", 8002, ttl=10)
+    port_store.bind_port("renewed", 8003, ttl=10)
+    port_store.bind_port("mine", 8004, pid=os.getpid())
+    port_store.bind_port("exited", 8005, pid=2**22 + 1)
+    lease = port_store.lease_for_app("Expired")
+    assert lease is not None and lease.pid is None
+    assert port_store.lease_for_app("mine") == port_for.BindingLease(None, os.getpid())
+    assert port_store.lease_for_app("forever") is None
+
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now + 5)
+    assert port_store.bind_port("renewed", ttl=10) == 8003
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+
+    assert port_store.gc() == [("expired", 8002), ("exited", 8005)]
+    assert port_store.bound_ports() == [("forever", 8001), ("renewed", 8003), ("mine", 8004)]
+    assert PortStore(port_store._config).bound_ports() == port_store.bound_ports()
+    assert port_store.gc() == []
+
+    port_store.unbind_port("renewed")
+    port_store.bind_port("renewed", 8003)
+    assert port_store.lease_for_app("renewed") is None
+
+
+def test_gc_leases_persisted(port_store: PortStore) -> None:
+    """Leases are saved alongside bindings, and read by other stores."""
+    port_store.bind_ports({"foo": 8001, "bar": 8002}, ttl=-1)
+    assert PortStore(port_store._config).gc() == [("foo", 8001), ("bar", 8002)]
+    assert PortStore(port_store._config).bound_ports() == []
+
+
+def test_ini_leases_section(tmp_path: Path) -> None:
+    """Leases of INI files don't change how bindings are stored."""
+    path = tmp_path / "ports.conf"
+    PortStore(str(path)).bind_port("foo", 8001, ttl=60, pid=42)
+    ini = ConfigParser()
+    ini.read(path)
+    assert ini.defaults() == {"foo": "8001"}
+    assert ini.get("port-for:leases", "foo").endswith(" pid=42")
@@ -0,0 +1,20 @@
+"""Tests for port_for.unassigned."""
+
+import port_for
+from port_for import unassigned
+from port_for.utils import PortRanges
+
+
+def test_bitmap_matches_ranges() -> None:
+    """Shipped bitmap holds the same data as UNASSIGNED_RANGES."""
+    assert unassigned.port_ranges() == PortRanges(port_for.UNASSIGNED_RANGES)
+    assert unassigned.mask() == PortRanges(port_for.UNASSIGNED_RANGES).to_mask()
+
+
+def test_is_unassigned() -> None:
+    """Bit lookups for well-known and unassigned ports."""
+    assert not unassigned.is_unassigned(80)
+    assert unassigned.is_unassigned(28)
+    assert unassigned.is_unassigned(49150)
+    assert not unassigned.is_unassigned(65536)
+    assert not unassigned.is_unassigned(-1)
@@ -0,0 +1,74 @@
+"""Tests for port_for.utils."""
+
+import random
+
+import pytest
+
+from port_for.utils import PortRanges, ranges_to_set
+
+
+def _random_ranges(rng: random.Random) -> list[tuple[int, int]]:
+    ranges = []
+    for _ in range(rng.randint(0, 8)):
+        low = rng.randint(0, 200)
+        ranges.append((low, low + rng.randint(0, 30)))
+    return ranges
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_port_ranges_matches_set(seed: int) -> None:
+    """PortRanges set operations agree with python sets."""
+    rng = random.Random(seed)
+    a_ranges, b_ranges = _random_ranges(rng), _random_ranges(rng)
+    a, b = PortRanges(a_ranges), PortRanges(b_ranges)
+    a_set, b_set = ranges_to_set(a_ranges), ranges_to_set(b_ranges)
+
+    assert set(a) == a_set
+    assert len(a) == len(a_set)
+    assert set(a | b) == a_set | b_set
+    assert set(a & b) == a_set & b_set
+    assert set(a - b) == a_set - b_set
+    assert set(a.complement(0, 250)) == set(range(251)) - a_set
+    for port in range(-1, 252):
+        assert (port in a) == (port in a_set)
+
+
+def test_port_ranges_normalized() -> None:
+    """Overlapping and adjacent ranges are merged."""
+    ranges = PortRanges([(10, 20), (1, 5), (6, 8), (15, 25), (30, 29)])
+    assert ranges.ranges == ((1, 8), (10, 25))
+    assert ranges == PortRanges.from_ports([1, 2, 3, 4, 5, 6, 7, 8] + list(range(10, 26)))
+
+
+def test_port_ranges_with_sets() -> None:
+    """PortRanges interoperates with builtin sets."""
+    ranges = PortRanges([(1, 3)])
+    assert ranges == {1, 2, 3}
+    assert (ranges - {2}).ranges == ((1, 1), (3, 3))
+    assert ({2, 7} | ranges) == {1, 2, 3, 7}
+    assert not PortRanges()
+
+
+@pytest.mark.parametrize("count", (1, 2, 3, 7, 32))
+def test_port_ranges_shard(count: int) -> None:
+    """Shards are disjoint, cover all ports and have nearly equal sizes."""
+    ports = PortRanges([(1, 5), (11, 15), (30, 30), (40, 80)])
+    shards = [ports.shard(index, count) for index in range(count)]
+    assert set().union(*shards) == set(ports)
+    assert sum(len(shard) for shard in shards) == len(ports)
+    assert max(len(shard) for shard in shards) - min(len(shard) for shard in shards) <= 1
+    with pytest.raises(ValueError):
+        ports.shard(count, count)
+
+
+def test_port_ranges_sample() -> None:
+    """Sampled ports are distinct, in ranges, and not excluded."""
+    ports = PortRanges([(1, 10), (100, 1000)])
+    assert [ports.port_at(index) for index in (0, 9, 10, 910)] == [1, 10, 100, 1000]
+    with pytest.raises(IndexError):
+        ports.port_at(911)
+    sample = ports.sample(100, exclude=range(100, 901))
+    assert len(sample) == 100
+    assert len(set(sample)) == 100
+    assert set(sample) <= set(ports) - set(range(100, 901))
+    assert sorted(ports.sample(200, exclude=range(50, 1000))) == list(range(1, 11)) + [1000]